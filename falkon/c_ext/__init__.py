@@ -28,6 +28,7 @@ lauum_cuda = _make_lazy_cuda_func("lauum")
 copy_triang = _make_lazy_cuda_func("copy_triang")
 mul_triang = _make_lazy_cuda_func("mul_triang")
 copy_transpose = _make_lazy_cuda_func("copy_transpose")
+copy_triang_transpose = _make_lazy_cuda_func("copy_triang_transpose")
 vec_mul_triang = _make_lazy_cuda_func("vec_mul_triang")
 
 # Sparse matrices
@@ -53,6 +54,7 @@ mem_get_info = _make_lazy_cuda_func("mem_get_info")
 cusolver_potrf_buffer_size = _make_lazy_cuda_func("cusolver_potrf_buffer_size")
 cusolver_potrf = _make_lazy_cuda_func("cusolver_potrf")
 potrf = _make_lazy_cuda_func("potrf")
+potrf_batched_ = _make_lazy_cuda_func("potrf_batched_")
 cublas_trsm = _make_lazy_cuda_func("cublas_trsm")
 cublas_trmm = _make_lazy_cuda_func("cublas_trmm")
 cublas_gemm = _make_lazy_cuda_func("cublas_gemm")
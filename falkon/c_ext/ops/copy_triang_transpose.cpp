@@ -0,0 +1,32 @@
+#include "copy_triang_transpose.h"
+
+#include <ATen/core/dispatch/Dispatcher.h>
+#include <torch/library.h>
+#include <torch/types.h>
+
+namespace falkon {
+namespace ops {
+
+at::Tensor copy_triang_transpose(
+        const at::Tensor &self,
+        at::Tensor &out,
+        const bool upper) {
+    static auto op = c10::Dispatcher::singleton()
+                       .findSchemaOrThrow("falkon::copy_triang_transpose", "")
+                       .typed<decltype(copy_triang_transpose)>();
+    at::AutoDispatchBelowAutograd guard;
+    at::tracer::impl::NoTracerDispatchMode tracer_guard;
+    return op.call(
+        self,
+        out,
+        upper
+    );
+}
+
+TORCH_LIBRARY_FRAGMENT(falkon, m) {
+  m.def(TORCH_SELECTIVE_SCHEMA(
+      "falkon::copy_triang_transpose(Tensor self, Tensor(a!) out, bool upper) -> Tensor(a!)"));
+}
+
+} // namespace ops
+} // namespace falkon
@@ -0,0 +1,14 @@
+#pragma once
+
+#include <ATen/ATen.h>
+
+namespace falkon {
+namespace ops {
+
+at::Tensor copy_triang_transpose(
+    const at::Tensor &self,
+    at::Tensor &out,
+    const bool upper);
+
+} // namespace ops
+} // namespace falkon
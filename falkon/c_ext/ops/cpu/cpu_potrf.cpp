@@ -1,6 +1,7 @@
 #include <ATen/ATen.h>
 #include <torch/library.h>
 #include <ATen/native/BatchLinearAlgebra.h>
+#include <c10/util/irange.h>
 
 #include "../helpers.h"
 #include "../mul_triang.h"
@@ -71,6 +72,17 @@ at::Tensor potrf_kernel(
     return mat;
 }
 
+void potrf_batched_kernel(
+        at::TensorList mats,
+        bool upper,
+        bool clean) {
+    // Each matrix is factorized in-place with a single dispatch for the whole batch. The loop is
+    // sequential since LAPACK may itself be multi-threaded: nesting thread-pools oversubscribes cores.
+    for (const auto i : c10::irange(mats.size())) {
+        at::Tensor mat = mats[i];
+        potrf_kernel(mat, upper, clean, /*overwrite=*/true);
+    }
+}
 
 } // namespace
 
@@ -78,6 +90,9 @@ TORCH_LIBRARY_IMPL(falkon, CPU, m) {
   m.impl(
       TORCH_SELECTIVE_NAME("falkon::potrf"),
       TORCH_FN(potrf_kernel));
+  m.impl(
+      TORCH_SELECTIVE_NAME("falkon::potrf_batched_"),
+      TORCH_FN(potrf_batched_kernel));
 }
 
 } // namespace ops
@@ -0,0 +1,129 @@
+#include <ATen/ATen.h>
+#include <ATen/MemoryOverlap.h>
+#include <ATen/cuda/CUDAContext.h>
+#include <c10/cuda/CUDAGuard.h>
+#include <torch/library.h>
+#include <ATen/native/cuda/KernelUtils.cuh>
+
+#include "../helpers.h"
+
+
+namespace falkon {
+namespace ops {
+
+namespace {
+
+#define NB 32
+#define BLOCK_ROWS 8
+
+/*
+  Fused version of `copy_triang` followed by `copy_transpose`.
+  Matrices are column-contiguous, with leading dimensions `ld_in` and `ld_out`.
+  Each block loads one NB * NB tile from the `upper` (or lower) triangle of `in`
+  into shared memory, and writes it to `out` twice: once in its original position
+  and once in the transposed position. Blocks which fall entirely in the other
+  triangle exit immediately. This way every element of the input triangle is read
+  once, instead of being read and written twice by the two separate kernels.
+*/
+template<typename scalar_t, bool upper>
+__global__
+void copy_triang_transpose_f(scalar_t* __restrict__ out, const scalar_t* __restrict__ in, const int64_t n, const int64_t ld_in, const int64_t ld_out)
+{
+    const unsigned bx = blockIdx.x;
+    const unsigned by = blockIdx.y;
+    if (upper ? bx > by : bx < by) {
+        return;
+    }
+    __shared__ scalar_t shrdMem[NB][NB+1];
+
+    const unsigned lx = threadIdx.x;
+    const unsigned ly = threadIdx.y;
+
+    // shrdMem[ly][lx] holds in[NB * bx + lx, NB * by + ly]
+    int64_t gx = lx + NB * bx;
+    int64_t gy = ly + NB * by;
+
+    #pragma unroll
+    for (unsigned repeat = 0; repeat < NB; repeat += blockDim.y) {
+        int64_t gy_ = gy + repeat;
+        if (gx < n && gy_ < n && (upper ? gx <= gy_ : gx >= gy_)) {
+            shrdMem[ly + repeat][lx] = in[gy_ * ld_in + gx];
+        }
+    }
+    __syncthreads();
+
+    // Original position
+    #pragma unroll
+    for (unsigned repeat = 0; repeat < NB; repeat += blockDim.y) {
+        int64_t gy_ = gy + repeat;
+        if (gx < n && gy_ < n && (upper ? gx <= gy_ : gx >= gy_)) {
+            out[gy_ * ld_out + gx] = shrdMem[ly + repeat][lx];
+        }
+    }
+
+    // Transposed position
+    gx = lx + NB * by;
+    gy = ly + NB * bx;
+
+    #pragma unroll
+    for (unsigned repeat = 0; repeat < NB; repeat += blockDim.y) {
+        int64_t gy_ = gy + repeat;
+        if (gx < n && gy_ < n && (upper ? gy_ <= gx : gy_ >= gx)) {
+            out[gy_ * ld_out + gx] = shrdMem[lx][ly + repeat];
+        }
+    }
+}
+
+
+at::Tensor copy_triang_transpose_kernel(
+      const at::Tensor &input,
+      at::Tensor &output,
+      const bool upper) {
+    CHECK_CUDA(input);
+    CHECK_CUDA(output);
+    TORCH_CHECK(input.dim() == 2 && input.size(0) == input.size(1), "Input must be a square 2D matrix.");
+    TORCH_CHECK(input.sizes() == output.sizes(), "Input and output matrices shapes must be equal.");
+    TORCH_CHECK(input.scalar_type() == output.scalar_type(), "Input and output matrices must have the same dtype.");
+    TORCH_CHECK(
+        (input.stride(0) == 1 || input.stride(1) == 1) && (output.stride(0) == 1 || output.stride(1) == 1),
+        "Input and output matrices must be contiguous in one dimension.");
+    // Each tile is written to two positions of the output, while other tiles are still read.
+    const auto overlap = at::get_overlap_status(input, output);
+    TORCH_CHECK(
+        overlap != at::MemOverlapStatus::Full && overlap != at::MemOverlapStatus::Partial,
+        "Input and output matrices must not share memory (in-place operation is not supported).");
+
+    // A C-contiguous input is the transpose of a F-contiguous one: flip the triangle.
+    // The output is symmetric, so its memory order only determines the leading dimension.
+    const bool fContig = is_fortran_contig(input);
+    const bool bupper = fContig ? upper : !upper;
+    const int64_t n = input.size(0);
+    const int64_t ld_in = fContig ? input.stride(1) : input.stride(0);
+    const int64_t ld_out = is_fortran_contig(output) ? output.stride(1) : output.stride(0);
+
+    const dim3 dimGrid(ceildiv(n, NB), ceildiv(n, NB), 1);
+    const dim3 dimBlock(NB, BLOCK_ROWS, 1);
+
+    AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), "dispatch_copy_triang_transpose", [&] {
+        at::DeviceGuard g(input.device());
+        at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
+        if (bupper) {
+            copy_triang_transpose_f<scalar_t, true><<<dimGrid, dimBlock, 0, stream.stream()>>>(
+                output.data_ptr<scalar_t>(), input.data_ptr<scalar_t>(), n, ld_in, ld_out);
+        } else {
+            copy_triang_transpose_f<scalar_t, false><<<dimGrid, dimBlock, 0, stream.stream()>>>(
+                output.data_ptr<scalar_t>(), input.data_ptr<scalar_t>(), n, ld_in, ld_out);
+        }
+    });
+    return output;
+}
+
+} // namespace
+
+TORCH_LIBRARY_IMPL(falkon, CUDA, m) {
+  m.impl(
+      TORCH_SELECTIVE_NAME("falkon::copy_triang_transpose"),
+      TORCH_FN(copy_triang_transpose_kernel));
+}
+} // namespace ops
+} // namespace falkon
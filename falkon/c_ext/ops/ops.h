@@ -2,6 +2,7 @@
 
 #include "copy_transpose.h"
 #include "copy_triang.h"
+#include "copy_triang_transpose.h"
 #include "csr2dense.h"
 #include "cublas_bindings.h"
 #include "lauum.h"
@@ -25,6 +25,22 @@ at::Tensor potrf(
     );
 }
 
+void potrf_batched_(
+        at::TensorList mats,
+        bool upper,
+        bool clean) {
+    static auto op = c10::Dispatcher::singleton()
+                       .findSchemaOrThrow("falkon::potrf_batched_", "")
+                       .typed<decltype(potrf_batched_)>();
+    at::AutoDispatchBelowAutograd guard;
+    at::tracer::impl::NoTracerDispatchMode tracer_guard;
+    op.call(
+        mats,
+        upper,
+        clean
+    );
+}
+
 at::Tensor parallel_potrf(
      c10::IntArrayRef devices,
      c10::IntArrayRef block_starts,
@@ -52,6 +68,8 @@ at::Tensor parallel_potrf(
 TORCH_LIBRARY_FRAGMENT(falkon, m) {
   m.def(TORCH_SELECTIVE_SCHEMA(
       "falkon::potrf(Tensor(a!) mat, bool upper, bool clean, bool overwrite) -> Tensor(a!)"));
+  m.def(TORCH_SELECTIVE_SCHEMA(
+      "falkon::potrf_batched_(Tensor(a!)[] mats, bool upper, bool clean) -> ()"));
   m.def(TORCH_SELECTIVE_SCHEMA(
       "falkon::parallel_potrf(int[] devices, int[] block_starts, int[] block_ends, int[] block_sizes, int[] block_devices, int[] block_ids, Tensor(a!) A) -> Tensor(a!)"));
 }
@@ -11,6 +11,11 @@ at::Tensor potrf(
         bool clean,
         bool overwrite);
 
+void potrf_batched_(
+        at::TensorList mats,
+        bool upper,
+        bool clean);
+
 at::Tensor parallel_potrf(
      c10::IntArrayRef devices,
      c10::IntArrayRef block_starts,
@@ -1,4 +1,13 @@
-from .wrapper import copy_triang, mul_triang, potrf, square_norm, trsm, vec_mul_triang, zero_triang
+from .wrapper import (
+    copy_triang,
+    mul_triang,
+    potrf,
+    potrf_batched,
+    square_norm,
+    trsm,
+    vec_mul_triang,
+    zero_triang,
+)
 
 __all__ = (
     "zero_triang",
@@ -6,6 +15,7 @@ __all__ = (
     "copy_triang",
     "vec_mul_triang",
     "potrf",
+    "potrf_batched",
     "trsm",
     "square_norm",
 )
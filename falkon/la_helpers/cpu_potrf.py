@@ -0,0 +1,71 @@
+import functools
+import warnings
+
+import torch
+
+from falkon import c_ext
+
+
+@functools.lru_cache(maxsize=None)
+def _has_mm_out_dtype() -> bool:
+    """Whether `torch.mm` can multiply bfloat16 matrices into a float32 output on the CPU."""
+    a = torch.ones(2, 2, dtype=torch.bfloat16)
+    try:
+        return torch.mm(a, a, out_dtype=torch.float32).dtype == torch.float32
+    except (TypeError, RuntimeError, NotImplementedError):
+        return False
+
+
+def _syrk_lower_bf16(C: torch.Tensor, P: torch.Tensor, block_size: int) -> None:
+    """In-place `C -= tril(P @ P.T)`, with bfloat16 operands and float32 accumulation.
+
+    Only the lower triangle of `C` is updated, one block-column at a time, so that the
+    temporary products have size `C.shape[0] x block_size`. Requires :func:`_has_mm_out_dtype`.
+    """
+    P_low = P.to(dtype=torch.bfloat16)
+    n = C.shape[0]
+    for j in range(0, n, block_size):
+        je = min(j + block_size, n)
+        update = torch.mm(P_low[j:], P_low[j:je].T, out_dtype=torch.float32)
+        update[: je - j].tril_()  # The diagonal block is only updated in its lower triangle
+        C[j:, j:je].sub_(update)
+
+
+def cpu_potrf_mixed(
+    mat: torch.Tensor, upper: bool, clean: bool, overwrite: bool, block_size: int = 256
+) -> torch.Tensor:
+    """Blocked Cholesky decomposition with bfloat16 trailing-matrix updates.
+
+    Diagonal blocks are factorized with LAPACK and panels are solved with TRSM, both in the
+    precision of `mat`. The trailing (SYRK) updates, which account for most of the FLOPs, are
+    computed on bfloat16 copies of the panels with float32 accumulation. The result is
+    therefore less accurate than the one produced by a full-precision decomposition.
+    The triangle of `mat` which is not factorized is left untouched (unless `clean=True`).
+
+    If the installed PyTorch cannot multiply bfloat16 matrices into a float32 output, the
+    bfloat16 updates would be as slow as the float32 ones and less accurate: the full-precision
+    LAPACK decomposition is used instead.
+    """
+    if not _has_mm_out_dtype():
+        warnings.warn(
+            "Mixed-precision Cholesky requires `torch.mm` with `out_dtype` support. "
+            "Falling back to the full-precision decomposition."
+        )
+        return c_ext.potrf(mat, upper=upper, clean=clean, overwrite=overwrite)
+    if not overwrite:
+        mat = mat.clone()
+    # The upper factor of `mat` is the transpose of the lower factor of `mat.T`.
+    A = mat.T if upper else mat
+    n = A.shape[0]
+    for k in range(0, n, block_size):
+        e = min(k + block_size, n)
+        A11 = A[k:e, k:e]
+        c_ext.potrf(A11, upper=False, clean=False, overwrite=True)
+        if e == n:
+            break
+        A21 = A[e:, k:e]
+        A21.copy_(torch.linalg.solve_triangular(A11.tril().T, A21, upper=True, left=False))
+        _syrk_lower_bf16(A[e:, e:], A21, block_size)
+    if clean:
+        c_ext.mul_triang(mat, upper=not upper, preserve_diag=True, multiplier=0.0)
+    return mat
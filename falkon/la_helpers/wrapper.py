@@ -1,10 +1,11 @@
 """Wrap the the various linear-algebra helpers which use c extension
 """
-from typing import Optional
+from typing import List, Optional, Sequence
 
 import torch
 
 from falkon import c_ext
+from falkon.la_helpers.cpu_potrf import cpu_potrf_mixed
 from falkon.la_helpers.cpu_trsm import cpu_trsm
 from falkon.utils.helpers import check_same_device
 
@@ -14,6 +15,7 @@ __all__ = (
     "copy_triang",
     "vec_mul_triang",
     "potrf",
+    "potrf_batched",
     "trsm",
     "square_norm",
 )
@@ -96,14 +98,52 @@ def vec_mul_triang(mat: torch.Tensor, multipliers: torch.Tensor, upper: bool, si
     return c_ext.vec_mul_triang(mat, multipliers, upper=upper, side=side == 1)
 
 
-def potrf(mat: torch.Tensor, upper: bool, clean: bool, overwrite: bool, cuda: bool) -> torch.Tensor:
+def potrf(
+    mat: torch.Tensor, upper: bool, clean: bool, overwrite: bool, cuda: bool, mixed_precision: bool = False
+) -> torch.Tensor:
     if mat.is_cuda or cuda:
         raise NotImplementedError(
             "'potrf' is only implemented for CPU tensors. See the ooc_ops module for CUDA implementations."
         )
+    if mixed_precision and mat.dtype == torch.float32:
+        # Trailing updates in bfloat16: faster, but less accurate than the LAPACK routine.
+        return cpu_potrf_mixed(mat, upper=upper, clean=clean, overwrite=overwrite)
     return c_ext.potrf(mat, upper=upper, clean=clean, overwrite=overwrite)
 
 
+def potrf_batched(mats: Sequence[torch.Tensor], upper: bool, clean: bool, overwrite: bool) -> List[torch.Tensor]:
+    """Cholesky decomposition of several independent matrices with a single call.
+
+    This is equivalent to calling :func:`potrf` on each matrix, but the loop over the matrices
+    runs within the C extension. Matrices may have different sizes, data-types and
+    memory layouts.
+
+    Parameters
+    ----------
+    mats
+        Sequence of square, positive-definite CPU tensors.
+    upper
+        Whether to compute the upper, or the lower Cholesky factor.
+    clean
+        Whether to set the other triangle of each output to zero.
+    overwrite
+        Whether the factorization should overwrite the input matrices.
+
+    Returns
+    -------
+    factors
+        List of Cholesky factors, in the same order as `mats`. If `overwrite` is True, these are
+        the input tensors themselves.
+    """
+    if any(mat.is_cuda for mat in mats):
+        raise NotImplementedError(
+            "'potrf_batched' is only implemented for CPU tensors. See the ooc_ops module for CUDA implementations."
+        )
+    factors = list(mats) if overwrite else [mat.clone() for mat in mats]
+    c_ext.potrf_batched_(factors, upper=upper, clean=clean)
+    return factors
+
+
 def trsm(v: torch.Tensor, A: torch.Tensor, alpha: float, lower: int = 0, transpose: int = 0) -> torch.Tensor:
     if isinstance(A, torch.Tensor):
         if isinstance(v, torch.Tensor):
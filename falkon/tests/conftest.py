@@ -1,5 +1,7 @@
 import dataclasses
+import os
 from contextlib import contextmanager
+from typing import Dict, Tuple
 
 import numpy as np
 import pytest
@@ -19,29 +21,35 @@ if decide_cuda():
         torch.cuda.init()
 
 
+# Setting FALKON_SKIP_MEM_CHECK turns `memory_checker` into a no-op.
+skip_mem_check = bool(os.environ.get("FALKON_SKIP_MEM_CHECK"))
+
+
 @contextmanager
 def memory_checker(opt: FalkonOptions, extra_mem=0, check_cpu=True):
     is_cpu = opt.use_cpu
     mem_check = False
     if (is_cpu and check_cpu and opt.max_cpu_mem < np.inf) or (not is_cpu and opt.max_gpu_mem < np.inf):
-        mem_check = True
+        mem_check = not skip_mem_check
+    if not mem_check:
+        yield opt
+        return
 
-    start_ram = None
-    if mem_check and not is_cpu:
+    if not is_cpu:
         devices = list(range(torch.cuda.device_count()))
         start_ram = {}
         for dev in devices:
             tcd.reset_peak_memory_stats(dev)
             # We have to work around buggy memory stats: sometimes reset doesn't work as expected.
             start_ram[dev] = torch.cuda.max_memory_allocated(dev)
-    elif mem_check:
+    else:
         start_ram = _cpu_used_mem(uss=True)
         opt = dataclasses.replace(opt, max_cpu_mem=opt.max_cpu_mem + start_ram)
 
     yield opt
 
     # Check memory usage
-    if mem_check and not is_cpu:
+    if not is_cpu:
         devices = list(range(torch.cuda.device_count()))
         for dev in devices:
             used_ram = tcd.max_memory_allocated(dev) - start_ram[dev] - extra_mem
@@ -50,7 +58,7 @@ def memory_checker(opt: FalkonOptions, extra_mem=0, check_cpu=True):
                     "DEV %d - Memory usage (%.2fMB) exceeds allowed usage (%.2fMB)"
                     % (dev, used_ram / 2**20, opt.max_gpu_mem / 2**20)
                 )
-    elif mem_check:
+    else:
         used_ram = _cpu_used_mem(uss=True) - start_ram - extra_mem
         if used_ram > opt.max_cpu_mem:
             raise MemoryError(
@@ -105,6 +113,31 @@ def fix_mats(*mats, order, device, dtype):
             yield fix_mat(m, order=order[i], device=device[i], dtype=dtype[i])
 
 
+_fixed_mats_cache = {}
+
+
+def cached_fix_mats(*mats, order, device, dtype):
+    """Memoized version of :func:`fix_mats`, where each input is cached by its identity.
+
+    The returned tensors are shared between tests, hence they must not be modified in-place.
+    The cache is emptied at the end of each test module.
+    """
+    out = []
+    for mat in mats:
+        key = (id(mat), order, str(device), np.dtype(dtype).name)
+        if key not in _fixed_mats_cache:
+            # Storing the input keeps it alive, so its id cannot be reused by another tensor.
+            _fixed_mats_cache[key] = mat, next(fix_mats(mat, order=order, device=device, dtype=dtype))
+        out.append(_fixed_mats_cache[key][1])
+    return tuple(out)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def clear_fixed_mats_cache():
+    yield
+    _fixed_mats_cache.clear()
+
+
 def fix_sparse_mat(t, dtype, device="cpu"):
     out = t.to(dtype=numpy_to_torch_type(dtype), device=device)
     return out
@@ -130,3 +163,64 @@ def make_tuple(val, length):
     if isinstance(val, (tuple, list)):
         assert len(val) == length, "Input to `make_tuple` is already a list of the incorrect length."
     return tuple([val] * length)
+
+
+def assert_all_close(actual: torch.Tensor, others: Dict[str, torch.Tensor], rtol: float, atol: float):
+    """Check that all tensors in `others` are close to `actual`, with a single comparison kernel.
+
+    The keys of `others` are the error messages. If some tensor does not match, the first
+    mismatching one is checked again with :func:`torch.testing.assert_close` for a detailed report.
+    """
+    stacked = torch.stack([other.detach() for other in others.values()], dim=0)
+    if torch.isclose(stacked, actual.detach().unsqueeze(0), rtol=rtol, atol=atol).all():
+        return
+    for msg, other in others.items():
+        torch.testing.assert_close(other, actual, rtol=rtol, atol=atol, msg=msg)
+
+
+class KernelReferences:
+    """Reference MM, MMV and D-MMV results, with cached conversions to other dtypes and devices."""
+
+    def __init__(self, mm: torch.Tensor, mmv: torch.Tensor, dmmv: torch.Tensor):
+        self.mm = mm
+        self.mmv = mmv
+        self.dmmv = dmmv
+        self._converted = {}
+
+    def to(self, dtype: torch.dtype, device) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        key = (dtype, str(device))
+        if key not in self._converted:
+            self._converted[key] = tuple(ref.to(dtype=dtype, device=device) for ref in (self.mm, self.mmv, self.dmmv))
+        return self._converted[key]
+
+
+def naive_references(naive_fn, m1, m2, v, w, **kernel_params) -> KernelReferences:
+    expected_mm = naive_fn(m1, m2, **kernel_params)
+    expected_mmv = expected_mm @ v
+    # Reusing `expected_mmv` costs O(nmt), less than the O(nm^2) of expanding into K^T K v + K^T w.
+    expected_dmmv = expected_mm.T @ (expected_mmv + w)
+    return KernelReferences(expected_mm, expected_mmv, expected_dmmv)
+
+
+@pytest.fixture(scope="module")
+def reference_kernels():
+    """Memoized reference results of the naive kernel implementations.
+
+    The returned function computes the MM, MMV and D-MMV references in double precision on the CPU.
+    Results are cached by the identity of the (unmodified) data fixtures, and by the values
+    of the kernel parameters, so each reference is computed once and shared by all tests
+    which differ only in memory order, device or dtype.
+    """
+    cache = {}
+
+    def get_references(naive_fn, m1, m2, v, w, **kernel_params) -> KernelReferences:
+        params_key = tuple((k, tuple(p.reshape(-1).tolist())) for k, p in sorted(kernel_params.items()))
+        key = (naive_fn, id(m1), id(m2), id(v), id(w), params_key)
+        if key not in cache:
+            m1_64, m2_64, v_64, w_64 = (mat.to(dtype=torch.float64, device="cpu") for mat in (m1, m2, v, w))
+            kernel_params = {k: p.to(dtype=torch.float64, device="cpu") for k, p in kernel_params.items()}
+            # Storing the inputs keeps them alive, so their ids cannot be reused by other tensors.
+            cache[key] = (m1, m2, v, w), naive_references(naive_fn, m1_64, m2_64, v_64, w_64, **kernel_params)
+        return cache[key][1]
+
+    return get_references
@@ -22,6 +22,12 @@ def gen_random(a, b, dtype, F=False, seed=0):
     return out
 
 
+def gen_random_torch(a, b, dtype=torch.float32, seed=0) -> torch.Tensor:
+    # Uniform in [0, 1) like `gen_random`, but drawn from a torch generator (values differ from numpy's).
+    generator = torch.Generator().manual_seed(seed)
+    return torch.rand(a, b, dtype=dtype, generator=generator)
+
+
 def gen_random_pd(t, dtype, F=False, seed=0):
     A = torch.from_numpy(gen_random(t, t, dtype, F, seed))
     copy_triang(A, upper=True)
@@ -27,6 +27,7 @@ def naive_diff_gaussian_kernel(X1, X2, sigma):
 
 def naive_diff_laplacian_kernel(X1, X2, sigma):
     # http://crsouza.com/2010/03/17/kernel-functions-for-machine-learning-applications/#laplacian
+    # Note that the Laplacian kernel uses the Euclidean (not the L1) distance.
     pairwise_dists = torch.cdist(X1 / sigma, X2 / sigma, p=2)
     return torch.exp(-pairwise_dists)
 
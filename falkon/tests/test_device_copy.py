@@ -6,7 +6,7 @@ from falkon import FalkonOptions
 from falkon.tests.conftest import fix_mat, memory_checker
 from falkon.tests.gen_random import gen_random
 from falkon.utils import decide_cuda
-from falkon.utils.device_copy import copy
+from falkon.utils.device_copy import _merge_adjacent, copy, copy_batched
 
 n = 10_000
 d = 1000
@@ -32,6 +32,16 @@ def large_mat():
     return torch.from_numpy(gen_random(2 * n, d, "float64", False, seed=92))
 
 
+@pytest.mark.parametrize(
+    "dev", ["cpu", pytest.param("cuda", marks=pytest.mark.skipif(not decide_cuda(), reason="No GPU found."))]
+)
+def test_copy_same_memory(mat, dev):
+    in_mat: torch.Tensor = fix_mat(mat[:100, :10], np.float64, "F", device=dev, copy=True, numpy=False)
+    out_mat = in_mat.view(in_mat.shape)
+    assert copy(in_mat, out_mat) is out_mat
+    torch.testing.assert_close(mat[:100, :10], out_mat.cpu(), rtol=0, atol=0)
+
+
 @pytest.mark.skipif(not decide_cuda(), reason="No GPU found.")
 @pytest.mark.parametrize("order", ["F", "C"])
 def test_copy_host_to_dev(mat, order):
@@ -115,6 +125,90 @@ def test_diff_sizes(mat, order, in_dev, size, out_size):
     torch.testing.assert_close(in_mat.cpu(), output.cpu(), rtol=1e-15, atol=1e-15)
 
 
+@pytest.mark.skipif(not decide_cuda(), reason="No GPU found.")
+@pytest.mark.parametrize("order", ["F", "C"])
+@pytest.mark.parametrize("in_dev", ["cpu", "cuda"])
+def test_diff_dtypes(mat, order, in_dev):
+    if in_dev == "cuda":
+        out_dev = "cpu"
+    else:
+        out_dev = "cuda"
+    in_mat: torch.Tensor = fix_mat(mat, np.float64, order=order, device=in_dev, copy=True, numpy=False)
+    in_mat = in_mat[:500, :100]
+
+    if order == "F":
+        output = torch.empty_strided((600, 100), (1, 600), dtype=torch.float32, device=out_dev)
+    else:
+        output = torch.empty_strided((600, 100), (100, 1), dtype=torch.float32, device=out_dev)
+    output = output[:500, :100]
+
+    copy(in_mat, output, allow_dtype_change=True)
+
+    torch.testing.assert_close(in_mat.cpu().to(torch.float32), output.cpu(), rtol=1e-6, atol=1e-6)
+
+
+@pytest.mark.skipif(not decide_cuda(), reason="No GPU found.")
+@pytest.mark.parametrize("order", ["F", "C"])
+@pytest.mark.parametrize("in_dev", ["cpu", "cuda"])
+def test_diff_dtypes_non_blocking(mat, order, in_dev):
+    out_dev = "cpu" if in_dev == "cuda" else "cuda"
+    # More copies than staging slots, each with different data: slots are reused while the
+    # earlier copies may still be in flight.
+    in_mats = [
+        fix_mat(mat[i * 500 : (i + 1) * 500, :100], np.float64, order=order, device=in_dev, copy=True, numpy=False)
+        for i in range(4)
+    ]
+    strides = (1, 500) if order == "F" else (100, 1)
+    outputs = [torch.empty_strided((500, 100), strides, dtype=torch.float32, device=out_dev) for _ in in_mats]
+
+    for in_mat, output in zip(in_mats, outputs):
+        copy(in_mat, output, non_blocking=True, allow_dtype_change=True)
+    torch.cuda.synchronize()
+
+    for in_mat, output in zip(in_mats, outputs):
+        torch.testing.assert_close(in_mat.cpu().to(torch.float32), output.cpu(), rtol=1e-6, atol=1e-6)
+
+
+@pytest.mark.skipif(not decide_cuda(), reason="No GPU found.")
+@pytest.mark.parametrize("order", ["F", "C"])
+@pytest.mark.parametrize("in_dev", ["cpu", "cuda"])
+def test_copy_batched(mat, order, in_dev):
+    if in_dev == "cuda":
+        out_dev = "cpu"
+    else:
+        out_dev = "cuda"
+    in_mat: torch.Tensor = fix_mat(mat, np.float64, order=order, device=in_dev, copy=True, numpy=False)
+    in_mat = in_mat[:1000, :100]
+    output = torch.empty_strided(in_mat.size(), in_mat.stride(), dtype=in_mat.dtype, device=out_dev)
+    other_output = torch.empty_strided(in_mat.size(), in_mat.stride(), dtype=in_mat.dtype, device=out_dev)
+
+    # Row and column tiles which can be merged, followed by tiles which cannot.
+    pairs = [(in_mat[i : i + 100], output[i : i + 100]) for i in range(0, 500, 100)]
+    pairs += [(in_mat[500:, j : j + 10], output[500:, j : j + 10]) for j in range(0, 100, 10)]
+    pairs += [(in_mat[i : i + 250], other_output[i : i + 250]) for i in range(750, -1, -250)]
+    copy_batched(pairs)
+
+    torch.testing.assert_close(in_mat.cpu(), output.cpu(), rtol=1e-15, atol=1e-15)
+    torch.testing.assert_close(in_mat.cpu(), other_output.cpu(), rtol=1e-15, atol=1e-15)
+
+
+@pytest.mark.parametrize("order", ["F", "C"])
+def test_merge_adjacent(mat, order):
+    in_mat: torch.Tensor = fix_mat(mat[:10, :10], np.float64, order=order, device="cpu", copy=True, numpy=False)
+
+    def tile(rows, cols):
+        # With F-order the roles of rows and columns are swapped, so the same tiles are (non-)adjacent.
+        return in_mat[rows, cols] if order == "C" else in_mat[cols, rows]
+
+    merged = _merge_adjacent(tile(slice(0, 2), slice(0, 5)), tile(slice(0, 2), slice(5, 10)))
+    torch.testing.assert_close(merged, tile(slice(0, 2), slice(0, 10)), rtol=0, atol=0)
+    merged = _merge_adjacent(tile(slice(0, 2), slice(0, 10)), tile(slice(2, 5), slice(0, 10)))
+    torch.testing.assert_close(merged, tile(slice(0, 5), slice(0, 10)), rtol=0, atol=0)
+    # The end of line 3 is followed by the start of line 4 in memory, but the two tiles are not a rectangle.
+    assert _merge_adjacent(tile(slice(3, 4), slice(5, 10)), tile(slice(4, 5), slice(0, 5))) is None
+    assert _merge_adjacent(tile(slice(3, 4), slice(8, 10)), tile(slice(4, 5), slice(0, 2))) is None
+
+
 @pytest.mark.skipif(not decide_cuda(), reason="No GPU found.")
 @pytest.mark.parametrize("order", ["F", "C"])
 @pytest.mark.parametrize("in_dev", ["cpu", "cuda"])
@@ -1,5 +1,10 @@
 import dataclasses
+import functools
+import itertools
+import math
+import os
 import time
+from typing import Optional
 
 import numpy as np
 import pytest
@@ -8,8 +13,15 @@ import torch
 from falkon.kernels import GaussianKernel, LaplacianKernel, LinearKernel, MaternKernel, PolynomialKernel
 from falkon.mmv_ops.utils import CUDA_EXTRA_MM_RAM
 from falkon.options import FalkonOptions
-from falkon.tests.conftest import fix_mats, memory_checker
-from falkon.tests.gen_random import gen_random
+from falkon.tests.conftest import (
+    KernelReferences,
+    assert_all_close,
+    cached_fix_mats,
+    fix_mats,
+    memory_checker,
+    naive_references,
+)
+from falkon.tests.gen_random import gen_random_torch
 from falkon.tests.naive_kernels import (
     naive_diff_gaussian_kernel,
     naive_diff_laplacian_kernel,
@@ -20,21 +32,35 @@ from falkon.tests.naive_kernels import (
 from falkon.utils import decide_cuda
 from falkon.utils.helpers import sizeof_dtype
 from falkon.utils.switches import decide_keops
+from falkon.utils.tensor_helpers import copy_same_stride
 
 cuda_mark = pytest.mark.skipif(not decide_cuda(), reason="No GPU found.")
 keops_mark = pytest.mark.skipif(not decide_keops(), reason="no KeOps found.")
+# With pytest-xdist (`--dist loadgroup`) all GPU tests run on the same worker.
+cuda_group_mark = pytest.mark.xdist_group(name="cuda")
 device_marks = [
     pytest.param("cpu", "cpu"),
-    pytest.param("cpu", "cuda", marks=[cuda_mark]),
-    pytest.param("cuda", "cuda", marks=[cuda_mark]),
+    pytest.param("cpu", "cuda", marks=[cuda_mark, cuda_group_mark]),
+    pytest.param("cuda", "cuda", marks=[cuda_mark, cuda_group_mark]),
 ]
 # Global data dimensions
 n = 20
 m = 5
 d = 3
 t = 2
+# `TestLargeComputations` has more points, the global data are the first rows of its data.
+n_large = 1500
+m_large = 250
 
 max_mem = 2 * 2**20
+# Anomaly detection makes backward passes (and gradcheck) much slower. Enable it for debugging only.
+detect_anomaly = bool(os.environ.get("FALKON_TEST_ANOMALY"))
+# Also run all kernel tests without an output tensor (`test_noout` always covers that path).
+deep_tests = bool(os.environ.get("FALKON_DEEP_TESTS"))
+# gradcheck normally only checks random projections of the Jacobian. Set to check the full Jacobian.
+fast_gradcheck = not os.environ.get("FALKON_TEST_FULL_GRADCHECK")
+# With FALKON_FAST_TEST, only one of the closed-form Matern cases, and the Gaussian limit, are tested.
+matern_nus = [1.5, np.inf] if os.environ.get("FALKON_FAST_TEST") else [0.5, 1.5, 2.5, np.inf]
 basic_options = FalkonOptions(debug=True, compute_arch_speed=False, max_cpu_mem=max_mem, max_gpu_mem=max_mem)
 
 
@@ -42,45 +68,83 @@ def fix_options(opt):
     # FIXME: On some systems (nest but not sperone), checking memory
     #        usage for CPU functions fails miserably due to inconsistent
     #        memory numbers being reported at random. We simply replace CPU
-    #        with a high number to avoid checking.
-    extra_cpu_mem = 10 * 2**30 if opt.use_cpu else 0
-    return dataclasses.replace(
-        opt,
-        max_cpu_mem=opt.max_cpu_mem + extra_cpu_mem,
-        max_gpu_mem=opt.max_gpu_mem + CUDA_EXTRA_MM_RAM,
-    )
+    #        with a high number, and skip the CPU check in `memory_checker`
+    #        (see `run_dense_test`) which would otherwise query the process
+    #        memory twice for every kernel call.
+    if opt.use_cpu:
+        return dataclasses.replace(opt, max_cpu_mem=opt.max_cpu_mem + 10 * 2**30)
+    return dataclasses.replace(opt, max_gpu_mem=opt.max_gpu_mem + CUDA_EXTRA_MM_RAM)
 
 
-@pytest.fixture(scope="module")
-def A() -> torch.Tensor:
-    return torch.from_numpy(gen_random(n, d, "float32", False, seed=92))
+@pytest.fixture(scope="session")
+def A_large() -> torch.Tensor:
+    return gen_random_torch(n_large, d, seed=92)
 
 
-@pytest.fixture(scope="module")
-def B() -> torch.Tensor:
-    return torch.from_numpy(gen_random(m, d, "float32", False, seed=93))
+@pytest.fixture(scope="session")
+def B_large() -> torch.Tensor:
+    return gen_random_torch(m_large, d, seed=93)
 
 
-@pytest.fixture(scope="module")
-def v() -> torch.Tensor:
-    return torch.from_numpy(gen_random(m, t, "float32", False, seed=94))
+@pytest.fixture(scope="session")
+def v_large() -> torch.Tensor:
+    return gen_random_torch(m_large, t, seed=94)
 
 
-@pytest.fixture(scope="module")
-def w() -> torch.Tensor:
-    return torch.from_numpy(gen_random(n, t, "float32", False, seed=95))
+@pytest.fixture(scope="session")
+def w_large() -> torch.Tensor:
+    return gen_random_torch(n_large, t, seed=95)
 
 
-@pytest.fixture(scope="module")
+@pytest.fixture(scope="session")
+def A(A_large) -> torch.Tensor:
+    return A_large[:n]
+
+
+@pytest.fixture(scope="session")
+def B(B_large) -> torch.Tensor:
+    return B_large[:m]
+
+
+@pytest.fixture(scope="session")
+def v(v_large) -> torch.Tensor:
+    return v_large[:m]
+
+
+@pytest.fixture(scope="session")
+def w(w_large) -> torch.Tensor:
+    return w_large[:n]
+
+
+@pytest.fixture(scope="session")
 def rtol():
     return {np.float64: 1e-8, torch.float64: 1e-8, np.float32: 1e-4, torch.float32: 1e-4}
 
 
-@pytest.fixture(scope="module")
+@pytest.fixture(scope="session")
 def atol():
     return {np.float64: 1e-8, torch.float64: 1e-8, np.float32: 1e-4, torch.float32: 1e-4}
 
 
+@pytest.fixture(scope="module")
+def scratch_pool():
+    """Output buffers which are reused across tests.
+
+    Each buffer is a flat tensor which grows when a larger output is requested. The returned
+    tensors are C-contiguous views over the start of the buffer.
+    """
+    buffers = {}
+
+    def get_buffer(name: str, shape, dtype: torch.dtype, device: torch.device) -> torch.Tensor:
+        key = (name, dtype, str(device))
+        numel = math.prod(shape)
+        if key not in buffers or buffers[key].numel() < numel:
+            buffers[key] = torch.empty(numel, dtype=dtype, device=device)
+        return buffers[key][:numel].view(shape)
+
+    return get_buffer
+
+
 @pytest.fixture(params=["single-sigma", "vec-sigma"], scope="class")
 def sigma(request) -> torch.Tensor:
     if request.param == "single-sigma":
@@ -89,121 +153,185 @@ def sigma(request) -> torch.Tensor:
         return torch.Tensor([3.0] * d)
 
 
-def run_dense_test(k_cls, naive_fn, m1, m2, v, w, rtol, atol, opt, grad_check: bool = True, **kernel_params):
-    torch.autograd.set_detect_anomaly(True)
+def sampled_product(orders, *axes):
+    """Parameters for all combinations of a memory order with the values in `axes`.
+
+    By default only a sample of the combinations is run. Each value of `axes` appears at least
+    once together with the first order (the one which is gradient-checked), and each other order
+    is run once. The other combinations are marked as `full`.
+    """
+    covering = [tuple(axis[i % len(axis)] for axis in axes) for i in range(max(len(axis) for axis in axes))]
+    sample = {(orders[0], *combo) for combo in covering} | {(order, *covering[0]) for order in orders[1:]}
+    axes = (orders, *axes)
+    return [
+        pytest.param(*combo, marks=[] if combo in sample else [pytest.mark.full])
+        for combo in itertools.product(*axes)
+    ]
+
+
+# Functions checked with gradcheck. The kernel is not rebuilt for every evaluation: gradcheck perturbs
+# the parameters of `kernel` in-place, so they can be ignored here. Bind `kernel` and `opt` with
+# `functools.partial`.
+def _gradcheck_mm(m1, m2, *kernel_params, kernel, opt=None):
+    return kernel(m1, m2, opt=opt)
 
-    kernel = k_cls(**kernel_params)
 
-    m1_wgrad = m1.clone().requires_grad_()
-    m2_wgrad = m2.clone().requires_grad_()
-    v_wgrad = v.clone().requires_grad_()
-    w_wgrad = w.clone().requires_grad_()
-    kernel_params_wgrad = {k: v.clone().requires_grad_() for k, v in kernel.diff_params.items()}
+def _gradcheck_mmv(m1, m2, v, *kernel_params, kernel, opt=None):
+    return kernel.mmv(m1, m2, v, opt=opt)
+
+
+def _gradcheck_dmmv(m1, m2, v, w, *kernel_params, kernel, opt=None):
+    return kernel.dmmv(m1, m2, v, w, opt=opt)
+
+
+def run_mm_only(k_cls, m1, m2, opt, **kernel_params):
+    """Build the kernel and run a single MM. For tests which only check for errors."""
+    kernel = k_cls(**kernel_params)
+    out = torch.empty(m1.shape[0], m2.shape[0], dtype=m1.dtype, device=m1.device)
+    return kernel(m1, m2, out=out, opt=fix_options(opt))
+
+
+def run_dense_test(
+    k_cls,
+    naive_fn,
+    m1,
+    m2,
+    v,
+    w,
+    rtol,
+    atol,
+    opt,
+    scratch_pool,
+    grad_check: bool = True,
+    check_noout: bool = deep_tests,
+    expected: Optional[KernelReferences] = None,
+    **kernel_params,
+):
+    # Also resets the global flag, in case another test module left it enabled.
+    torch.autograd.set_detect_anomaly(detect_anomaly)
+
+    # Kernel objects are cheap to build. They do not hold compiled KeOps routines: those are
+    # cached by KeOps itself, per formula and dtype.
+    kernel = k_cls(**kernel_params)
+    n_rows, m_rows, t_cols = m1.shape[0], m2.shape[0], v.shape[1]
+
+    # The inputs are never modified in-place, so the grad-tracked versions can alias them.
+    m1_wgrad = m1.detach().requires_grad_()
+    m2_wgrad = m2.detach().requires_grad_()
+    v_wgrad = v.detach().requires_grad_()
+    w_wgrad = w.detach().requires_grad_()
+    kernel_params_wgrad = {k: v.detach().requires_grad_() for k, v in kernel.diff_params.items()}
     opt = fix_options(opt)
 
     kernel_wgrad = k_cls(**kernel.nondiff_params, **kernel_params_wgrad, opt=opt)
+    # Finite differences are only meaningful in double precision.
+    grad_check = grad_check and m1.dtype == torch.float64
+    if grad_check:
+        # Finite-difference checks scale with the number of inputs, so they run on a few rows only.
+        m1_gc, m2_gc, v_gc, w_gc = (
+            copy_same_stride(mat[:rows]).requires_grad_() for mat, rows in ((m1, 4), (m2, 3), (v, 3), (w, 4))
+        )
 
-    expected_mm = naive_fn(m1, m2, **kernel_params)
+    if expected is None:
+        expected = naive_references(naive_fn, m1, m2, v, w, **kernel_params)
+    expected_mm, expected_mmv, expected_dmmv = expected.to(m1.dtype, m1.device)
+    # Memory usage is checked for the calls with `out`, with and without gradients: differentiable
+    # calls choose their block sizes differently. The calls without `out` share the code path of
+    # the non-differentiable calls, and are memory-checked in `test_noout`.
+    # The operations cannot overlap on GPU: each one runs on its own streams, and synchronizes
+    # them before returning.
     if opt.keops_active != "force":  # Don't test MM if keops is active
         # 1. MM
-        mm_out = torch.empty(m1.shape[0], m2.shape[0], dtype=m1.dtype, device=m1.device)
-        mm_out_wgrad = torch.empty(m1.shape[0], m2.shape[0], dtype=m1.dtype, device=m1.device)
-        with memory_checker(opt) as new_opt:
+        mm_out = scratch_pool("mm", (n_rows, m_rows), m1.dtype, m1.device)
+        mm_out_wgrad = scratch_pool("mm_wgrad", (n_rows, m_rows), m1.dtype, m1.device)
+        with memory_checker(opt, check_cpu=False) as new_opt:
             actual = kernel(m1, m2, out=mm_out, opt=new_opt)
-        with memory_checker(opt, extra_mem=m1.shape[0] * m2.shape[0] * sizeof_dtype(m1.dtype)) as new_opt:
-            actual_noout = kernel(m1, m2, opt=new_opt)
-        with memory_checker(opt) as new_opt:
-            actual_wgrad = kernel_wgrad(m1_wgrad, m2_wgrad, out=mm_out_wgrad, opt=new_opt)
-            # torch.autograd.grad(
-            #    actual_wgrad.sum(), [m1_wgrad, m2_wgrad] + list(kernel_params_wgrad.values()))
+        if check_noout:
+            actual_noout = kernel(m1, m2, opt=opt)
+        checks = {}
+        if grad_check:
+            with memory_checker(opt, check_cpu=False) as new_opt:
+                actual_wgrad = kernel_wgrad(m1_wgrad, m2_wgrad, out=mm_out_wgrad, opt=new_opt)
+                # torch.autograd.grad(
+                #    actual_wgrad.sum(), [m1_wgrad, m2_wgrad] + list(kernel_params_wgrad.values()))
+            assert mm_out_wgrad.data_ptr() == actual_wgrad.data_ptr(), "MM Output data tensor was not used"
+            checks["MM Wgrad and normal return different stuff"] = actual_wgrad
 
         assert mm_out.data_ptr() == actual.data_ptr(), "MM Output data tensor was not used"
-        assert mm_out_wgrad.data_ptr() == actual_wgrad.data_ptr(), "MM Output data tensor was not used"
-        torch.testing.assert_close(
-            actual_wgrad, actual, rtol=rtol, atol=atol, msg="MM Wgrad and normal return different stuff"
-        )
-        torch.testing.assert_close(
-            actual_noout, actual, rtol=rtol, atol=atol, msg="MM with out and without return different stuff"
-        )
-        torch.testing.assert_close(expected_mm, actual, rtol=rtol, atol=atol, msg="MM result is incorrect")
+        if check_noout:
+            checks["MM with out and without return different stuff"] = actual_noout
+        checks["MM result is incorrect"] = expected_mm
+        assert_all_close(actual, checks, rtol=rtol, atol=atol)
 
         # 2. MM gradients
         if grad_check:
-
-            def autogradcheck_mm(_m1, _m2, *_kernel_params):
-                return kernel_wgrad(_m1, _m2, opt=opt)
-
             torch.autograd.gradcheck(
-                autogradcheck_mm,
-                inputs=(m1_wgrad, m2_wgrad, *kernel_wgrad.diff_params.values()),
+                functools.partial(_gradcheck_mm, kernel=kernel_wgrad, opt=opt),
+                inputs=(m1_gc, m2_gc, *kernel_wgrad.diff_params.values()),
+                fast_mode=fast_gradcheck,
                 check_undefined_grad=False,  # TODO: Set to true this causes random segfaults with linear kernel.
             )
 
     # 3. MMV
-    mmv_out = torch.empty(m1.shape[0], v.shape[1], dtype=m1.dtype, device=m1.device)
-    mmv_out_wgrad = torch.empty(m1.shape[0], v.shape[1], dtype=m1.dtype, device=m1.device)
-    with memory_checker(opt) as new_opt:
+    mmv_out = scratch_pool("mmv", (n_rows, t_cols), m1.dtype, m1.device)
+    mmv_out_wgrad = scratch_pool("mmv_wgrad", (n_rows, t_cols), m1.dtype, m1.device)
+    with memory_checker(opt, check_cpu=False) as new_opt:
         actual = kernel.mmv(m1, m2, v, out=mmv_out, opt=new_opt)
-    with memory_checker(opt, extra_mem=m1.shape[0] * v.shape[1] * sizeof_dtype(m1.dtype)) as new_opt:
-        actual_noout = kernel.mmv(m1, m2, v, opt=new_opt)
-    with memory_checker(opt) as new_opt:
-        actual_wgrad = kernel_wgrad.mmv(m1_wgrad, m2_wgrad, v_wgrad, out=mmv_out_wgrad, opt=new_opt)
-        torch.autograd.grad(actual_wgrad.sum(), [m1_wgrad, m2_wgrad, v_wgrad] + list(kernel_wgrad.diff_params.values()))
+    if check_noout:
+        actual_noout = kernel.mmv(m1, m2, v, opt=opt)
+    checks = {}
+    if grad_check:
+        with memory_checker(opt, check_cpu=False) as new_opt:
+            actual_wgrad = kernel_wgrad.mmv(m1_wgrad, m2_wgrad, v_wgrad, out=mmv_out_wgrad, opt=new_opt)
+            torch.autograd.grad(
+                actual_wgrad.sum(), [m1_wgrad, m2_wgrad, v_wgrad] + list(kernel_wgrad.diff_params.values())
+            )
+        assert mmv_out_wgrad.data_ptr() == actual_wgrad.data_ptr(), "MMV Output data tensor was not used"
+        checks["MMV Wgrad and normal return different stuff"] = actual_wgrad
     assert mmv_out.data_ptr() == actual.data_ptr(), "MMV Output data tensor was not used"
-    assert mmv_out_wgrad.data_ptr() == actual_wgrad.data_ptr(), "MMV Output data tensor was not used"
-    torch.testing.assert_close(
-        actual_wgrad, actual, rtol=rtol, atol=atol, msg="MMV Wgrad and normal return different stuff"
-    )
-    torch.testing.assert_close(
-        actual_noout, actual, rtol=rtol, atol=atol, msg="MMV with out and without return different stuff"
-    )
-    expected_mmv = expected_mm @ v
-    torch.testing.assert_close(expected_mmv, actual, rtol=rtol, atol=atol, msg="MMV result is incorrect")
+    if check_noout:
+        checks["MMV with out and without return different stuff"] = actual_noout
+    checks["MMV result is incorrect"] = expected_mmv
+    assert_all_close(actual, checks, rtol=rtol, atol=atol)
 
     # 4. MMV gradients
     if grad_check:
-
-        def autogradcheck_mmv(_m1, _m2, _v, *_kernel_params):
-            return kernel_wgrad.mmv(_m1, _m2, _v, opt=opt)
-
         torch.autograd.gradcheck(
-            autogradcheck_mmv, inputs=(m1_wgrad, m2_wgrad, v_wgrad, *kernel_wgrad.diff_params.values())
+            functools.partial(_gradcheck_mmv, kernel=kernel_wgrad, opt=opt),
+            inputs=(m1_gc, m2_gc, v_gc, *kernel_wgrad.diff_params.values()),
+            fast_mode=fast_gradcheck,
         )
 
-    # 5. Double MMV (doesn't exist for gradients)
-    dmmv_grad_allowed = True
-    dmmv_out = torch.empty(m2.shape[0], v.shape[1], dtype=m1.dtype, device=m1.device)
-    with memory_checker(opt) as new_opt:
+    # 5. Double MMV. With gradients, it is only implemented by KeOps.
+    dmmv_grad_allowed = grad_check and kernel_wgrad.keops_can_handle_dmmv(m1, m2, v, w, opt)
+    dmmv_out = scratch_pool("dmmv", (m_rows, t_cols), m1.dtype, m1.device)
+    with memory_checker(opt, check_cpu=False) as new_opt:
         actual = kernel.dmmv(m1, m2, v, w, out=dmmv_out, opt=new_opt)
-    with memory_checker(opt, extra_mem=m2.shape[0] * v.shape[1] * sizeof_dtype(m1.dtype)) as new_opt:
-        actual_noout = kernel.dmmv(m1, m2, v, w, opt=new_opt)
-    with memory_checker(opt) as new_opt:
-        try:
+    if check_noout:
+        actual_noout = kernel.dmmv(m1, m2, v, w, opt=opt)
+    if dmmv_grad_allowed:
+        with memory_checker(opt, check_cpu=False) as new_opt:
             actual_wgrad = kernel_wgrad.dmmv(m1_wgrad, m2_wgrad, v_wgrad, w_wgrad, opt=new_opt)
-        except NotImplementedError as e:
-            assert new_opt.keops_active == "no", f"KeOps D-MMV raise error {e} unexpectedly"
-            # On the other hand it is expected that we throw a not implemented error.
-            dmmv_grad_allowed = False
+    elif grad_check:
+        # The error is raised before any computation.
+        with pytest.raises(NotImplementedError):
+            kernel_wgrad.dmmv(m1_wgrad, m2_wgrad, v_wgrad, w_wgrad, opt=opt)
 
     assert dmmv_out.data_ptr() == actual.data_ptr(), "D-MMV Output data tensor was not used"
+    checks = {}
     if dmmv_grad_allowed:
-        torch.testing.assert_close(
-            actual_wgrad, actual, rtol=rtol, atol=atol, msg="MMV Wgrad and normal return different stuff"
-        )
-    torch.testing.assert_close(
-        actual_noout, actual, rtol=rtol, atol=atol, msg="D-MMV with out and without return different stuff"
-    )
-    expected_dmmv = expected_mm.T @ (expected_mmv + w)
-    torch.testing.assert_close(expected_dmmv, actual, rtol=rtol, atol=atol, msg="D-MMV result is incorrect")
+        checks["MMV Wgrad and normal return different stuff"] = actual_wgrad
+    if check_noout:
+        checks["D-MMV with out and without return different stuff"] = actual_noout
+    checks["D-MMV result is incorrect"] = expected_dmmv
+    assert_all_close(actual, checks, rtol=rtol, atol=atol)
 
     # 6. D-MMV gradients
-    if grad_check and dmmv_grad_allowed:
-
-        def autogradcheck_dmmv(_m1, _m2, _v, _w, *_kernel_params):
-            return kernel_wgrad.dmmv(_m1, _m2, _v, _w, opt=opt)
-
+    if dmmv_grad_allowed:
         torch.autograd.gradcheck(
-            autogradcheck_dmmv, inputs=(m1_wgrad, m2_wgrad, v_wgrad, w_wgrad, *kernel_wgrad.diff_params.values())
+            functools.partial(_gradcheck_dmmv, kernel=kernel_wgrad, opt=opt),
+            inputs=(m1_gc, m2_gc, v_gc, w_gc, *kernel_wgrad.diff_params.values()),
+            fast_mode=fast_gradcheck,
         )
 
 
@@ -219,9 +347,14 @@ class TestLaplacianKernel:
             torch.float64: 4e-8,
         }
 
-    @pytest.mark.parametrize("order", ["C", "F"])
-    def test_dense_kernel(self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev, order):
-        A, B, v, w, sigma = fix_mats(A, B, v, w, sigma, order=order, device=input_dev, dtype=np.float64)
+    @pytest.mark.parametrize(
+        "order,sigma", sampled_product(["C", "F"], ["vec-sigma", "single-sigma"]), indirect=["sigma"]
+    )
+    def test_dense_kernel(
+        self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev, order, reference_kernels, scratch_pool
+    ):
+        expected = reference_kernels(TestLaplacianKernel.naive_fn, A, B, v, w, sigma=sigma)
+        A, B, v, w, sigma = cached_fix_mats(A, B, v, w, sigma, order=order, device=input_dev, dtype=np.float64)
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
         run_dense_test(
             TestLaplacianKernel.k_class,
@@ -233,12 +366,14 @@ class TestLaplacianKernel:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            expected=expected,
             sigma=sigma,
-            grad_check=True,
+            grad_check=order == "C",
         )
 
     def test_not_all_grads(self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev):
-        m1, m2, v, w, sigma = fix_mats(A, B, v, w, sigma, order="F", device=input_dev, dtype=np.float64)
+        m1, m2, v, w, sigma = cached_fix_mats(A, B, v, w, sigma, order="F", device=input_dev, dtype=np.float64)
 
         m1_wgrad = m1.clone().requires_grad_(False)
         m2_wgrad = m2.clone().requires_grad_()
@@ -250,19 +385,18 @@ class TestLaplacianKernel:
 
         kernel = self.k_class(s_wgrad, opt=opt)
 
-        def autogradcheck_mm(_m1, _m2, *_kernel_params):
-            return kernel(_m1, _m2)
-
-        torch.autograd.gradcheck(autogradcheck_mm, inputs=(m1_wgrad, m2_wgrad, *kernel.diff_params.values()))
-
-        def autogradcheck_mmv(_m1, _m2, _v, *_kernel_params):
-            return kernel.mmv(_m1, _m2, _v)
-
-        torch.autograd.gradcheck(autogradcheck_mmv, inputs=(m1_wgrad, m2_wgrad, v_wgrad, *kernel.diff_params.values()))
+        torch.autograd.gradcheck(
+            functools.partial(_gradcheck_mm, kernel=kernel), inputs=(m1_wgrad, m2_wgrad, *kernel.diff_params.values())
+        )
+        torch.autograd.gradcheck(
+            functools.partial(_gradcheck_mmv, kernel=kernel),
+            inputs=(m1_wgrad, m2_wgrad, v_wgrad, *kernel.diff_params.values()),
+        )
 
     @keops_mark
-    def test_keops_kernel(self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev):
-        A, B, v, w, sigma = fix_mats(A, B, v, w, sigma, order="C", device=input_dev, dtype=np.float64)
+    def test_keops_kernel(self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev, reference_kernels, scratch_pool):
+        expected = reference_kernels(TestLaplacianKernel.naive_fn, A, B, v, w, sigma=sigma)
+        A, B, v, w, sigma = cached_fix_mats(A, B, v, w, sigma, order="C", device=input_dev, dtype=np.float64)
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="force")
         run_dense_test(
             TestLaplacianKernel.k_class,
@@ -274,12 +408,17 @@ class TestLaplacianKernel:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            expected=expected,
             sigma=sigma,
         )
 
     @keops_mark
-    def test_keops_kernel_noncontig(self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev):
-        A, B, v, w, sigma = fix_mats(A, B, v, w, sigma, order="F", device=input_dev, dtype=np.float64)
+    def test_keops_kernel_noncontig(
+        self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev, reference_kernels, scratch_pool
+    ):
+        expected = reference_kernels(TestLaplacianKernel.naive_fn, A, B, v, w, sigma=sigma)
+        A, B, v, w, sigma = cached_fix_mats(A, B, v, w, sigma, order="F", device=input_dev, dtype=np.float64)
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="force")
         run_dense_test(
             TestLaplacianKernel.k_class,
@@ -291,6 +430,8 @@ class TestLaplacianKernel:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            expected=expected,
             sigma=sigma,
         )
         # TODO: Assert warning printed
@@ -301,9 +442,14 @@ class TestGaussianKernel:
     naive_fn = naive_diff_gaussian_kernel
     k_class = GaussianKernel
 
-    @pytest.mark.parametrize("order", ["C", "F"])
-    def test_dense_kernel(self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev, order):
-        A, B, v, w, sigma = fix_mats(A, B, v, w, sigma, order=order, device=input_dev, dtype=np.float64)
+    @pytest.mark.parametrize(
+        "order,sigma", sampled_product(["C", "F"], ["vec-sigma", "single-sigma"]), indirect=["sigma"]
+    )
+    def test_dense_kernel(
+        self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev, order, reference_kernels, scratch_pool
+    ):
+        expected = reference_kernels(TestGaussianKernel.naive_fn, A, B, v, w, sigma=sigma)
+        A, B, v, w, sigma = cached_fix_mats(A, B, v, w, sigma, order=order, device=input_dev, dtype=np.float64)
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
         run_dense_test(
             TestGaussianKernel.k_class,
@@ -315,12 +461,16 @@ class TestGaussianKernel:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            grad_check=order == "C",
+            expected=expected,
             sigma=sigma,
         )
 
     @keops_mark
-    def test_keops_kernel(self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev):
-        A, B, v, w, sigma = fix_mats(A, B, v, w, sigma, order="F", device=input_dev, dtype=np.float64)
+    def test_keops_kernel(self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev, reference_kernels, scratch_pool):
+        expected = reference_kernels(TestGaussianKernel.naive_fn, A, B, v, w, sigma=sigma)
+        A, B, v, w, sigma = cached_fix_mats(A, B, v, w, sigma, order="F", device=input_dev, dtype=np.float64)
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="force")
         run_dense_test(
             TestGaussianKernel.k_class,
@@ -332,26 +482,17 @@ class TestGaussianKernel:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            expected=expected,
             sigma=sigma,
         )
 
-    def test_wrong_sigma_dims(self, A, B, v, w, rtol, atol, input_dev, comp_dev):
+    def test_wrong_sigma_dims(self, A, B, input_dev, comp_dev):
         sigma = torch.tensor([2.0] * (d - 1), dtype=torch.float64)
-        A, B, v, w, sigma = fix_mats(A, B, v, w, sigma, order="F", device=input_dev, dtype=np.float64)
+        A, B, sigma = fix_mats(A, B, sigma, order="F", device=input_dev, dtype=np.float64)
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
         with pytest.raises(RuntimeError) as excinfo:
-            run_dense_test(
-                TestGaussianKernel.k_class,
-                TestGaussianKernel.naive_fn,
-                m1=A,
-                m2=B,
-                v=v,
-                w=w,
-                rtol=rtol[A.dtype],
-                atol=atol[A.dtype],
-                opt=opt,
-                sigma=sigma,
-            )
+            run_mm_only(TestGaussianKernel.k_class, m1=A, m2=B, opt=opt, sigma=sigma)
         if comp_dev == "cpu":
             assert f"The size of tensor a ({d}) must match the size of tensor b ({d - 1})" in str(
                 excinfo.value
@@ -365,13 +506,20 @@ class TestMaternKernel:
     naive_fn = naive_diff_matern_kernel
     k_class = MaternKernel
 
-    @pytest.fixture(params=[0.5, 1.5, 2.5, np.inf], scope="function")
+    @pytest.fixture(params=matern_nus, scope="class")
     def nu(self, request) -> torch.Tensor:
         return torch.tensor(request.param)
 
-    @pytest.mark.parametrize("order", ["C", "F"])
-    def test_dense_kernel(self, A, B, v, w, nu, sigma, rtol, atol, input_dev, comp_dev, order):
-        A, B, v, w, sigma = fix_mats(A, B, v, w, sigma, order=order, device=input_dev, dtype=np.float64)
+    @pytest.mark.parametrize(
+        "order,sigma,nu",
+        sampled_product(["C", "F"], ["vec-sigma", "single-sigma"], matern_nus),
+        indirect=["sigma", "nu"],
+    )
+    def test_dense_kernel(
+        self, A, B, v, w, nu, sigma, rtol, atol, input_dev, comp_dev, order, reference_kernels, scratch_pool
+    ):
+        expected = reference_kernels(TestMaternKernel.naive_fn, A, B, v, w, sigma=sigma, nu=nu)
+        A, B, v, w, sigma = cached_fix_mats(A, B, v, w, sigma, order=order, device=input_dev, dtype=np.float64)
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
         run_dense_test(
             TestMaternKernel.k_class,
@@ -383,13 +531,19 @@ class TestMaternKernel:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            grad_check=order == "C",
+            expected=expected,
             sigma=sigma,
             nu=nu,
         )
 
     @keops_mark
-    def test_keops_kernel(self, A, B, v, w, nu, sigma, rtol, atol, input_dev, comp_dev):
-        A, B, v, w, sigma = fix_mats(A, B, v, w, sigma, order="C", device=input_dev, dtype=np.float64)
+    def test_keops_kernel(
+        self, A, B, v, w, nu, sigma, rtol, atol, input_dev, comp_dev, reference_kernels, scratch_pool
+    ):
+        expected = reference_kernels(TestMaternKernel.naive_fn, A, B, v, w, sigma=sigma, nu=nu)
+        A, B, v, w, sigma = cached_fix_mats(A, B, v, w, sigma, order="C", device=input_dev, dtype=np.float64)
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="force")
         run_dense_test(
             TestMaternKernel.k_class,
@@ -401,29 +555,19 @@ class TestMaternKernel:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            expected=expected,
             sigma=sigma,
             nu=nu,
         )
 
-    def test_nu_fail(self, A, B, v, w, rtol, atol, input_dev, comp_dev):
+    def test_nu_fail(self, A, B, input_dev, comp_dev):
         sigma = torch.tensor([1.2])
         nu = torch.tensor(2.1)
-        A, B, v, w, sigma = fix_mats(A, B, v, w, sigma, order="F", device=input_dev, dtype=np.float64)
+        A, B, sigma = fix_mats(A, B, sigma, order="F", device=input_dev, dtype=np.float64)
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
         with pytest.raises(ValueError) as excinfo:
-            run_dense_test(
-                TestMaternKernel.k_class,
-                TestMaternKernel.naive_fn,
-                m1=A,
-                m2=B,
-                v=v,
-                w=w,
-                rtol=rtol[A.dtype],
-                atol=atol[A.dtype],
-                opt=opt,
-                sigma=sigma,
-                nu=nu,
-            )
+            run_mm_only(TestMaternKernel.k_class, m1=A, m2=B, opt=opt, sigma=sigma, nu=nu)
         assert f"The given value of nu = {nu:.1f} can only take values" in str(excinfo.value)
 
 
@@ -435,8 +579,9 @@ class TestLinearKernel:
     gamma = torch.tensor(2.0)
 
     @pytest.mark.parametrize("order", ["C", "F"])
-    def test_dense_kernel(self, A, B, v, w, rtol, atol, input_dev, comp_dev, order):
-        A, B, v, w, beta, gamma = fix_mats(
+    def test_dense_kernel(self, A, B, v, w, rtol, atol, input_dev, comp_dev, order, reference_kernels, scratch_pool):
+        expected = reference_kernels(TestLinearKernel.naive_fn, A, B, v, w, beta=self.beta, gamma=self.gamma)
+        A, B, v, w, beta, gamma = cached_fix_mats(
             A, B, v, w, self.beta, self.gamma, order=order, device=input_dev, dtype=np.float64
         )
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
@@ -450,13 +595,17 @@ class TestLinearKernel:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            grad_check=order == "C",
+            expected=expected,
             beta=beta,
             gamma=gamma,
         )
 
     @keops_mark
-    def test_keops_kernel(self, A, B, v, w, rtol, atol, input_dev, comp_dev):
-        A, B, v, w, beta, gamma = fix_mats(
+    def test_keops_kernel(self, A, B, v, w, rtol, atol, input_dev, comp_dev, reference_kernels, scratch_pool):
+        expected = reference_kernels(TestLinearKernel.naive_fn, A, B, v, w, beta=self.beta, gamma=self.gamma)
+        A, B, v, w, beta, gamma = cached_fix_mats(
             A, B, v, w, self.beta, self.gamma, order="C", device=input_dev, dtype=np.float64
         )
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="force")
@@ -470,6 +619,8 @@ class TestLinearKernel:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            expected=expected,
             beta=beta,
             gamma=gamma,
         )
@@ -484,8 +635,11 @@ class TestPolynomialKernel:
     degree = torch.tensor(1.5)
 
     @pytest.mark.parametrize("order", ["C", "F"])
-    def test_dense_kernel(self, A, B, v, w, rtol, atol, input_dev, comp_dev, order):
-        A, B, v, w, beta, gamma, degree = fix_mats(
+    def test_dense_kernel(self, A, B, v, w, rtol, atol, input_dev, comp_dev, order, reference_kernels, scratch_pool):
+        expected = reference_kernels(
+            TestPolynomialKernel.naive_fn, A, B, v, w, beta=self.beta, gamma=self.gamma, degree=self.degree
+        )
+        A, B, v, w, beta, gamma, degree = cached_fix_mats(
             A, B, v, w, self.beta, self.gamma, self.degree, order=order, device=input_dev, dtype=np.float64
         )
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
@@ -499,14 +653,20 @@ class TestPolynomialKernel:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            grad_check=order == "C",
+            expected=expected,
             beta=beta,
             gamma=gamma,
             degree=degree,
         )
 
     @keops_mark
-    def test_keops_kernel(self, A, B, v, w, rtol, atol, input_dev, comp_dev):
-        A, B, v, w, beta, gamma, degree = fix_mats(
+    def test_keops_kernel(self, A, B, v, w, rtol, atol, input_dev, comp_dev, reference_kernels, scratch_pool):
+        expected = reference_kernels(
+            TestPolynomialKernel.naive_fn, A, B, v, w, beta=self.beta, gamma=self.gamma, degree=self.degree
+        )
+        A, B, v, w, beta, gamma, degree = cached_fix_mats(
             A, B, v, w, self.beta, self.gamma, self.degree, order="C", device=input_dev, dtype=np.float64
         )
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
@@ -520,43 +680,69 @@ class TestPolynomialKernel:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            expected=expected,
             beta=beta,
             gamma=gamma,
             degree=degree,
         )
 
 
+@pytest.mark.parametrize("input_dev,comp_dev", device_marks)
+def test_noout(A, B, v, w, rtol, atol, input_dev, comp_dev, reference_kernels):
+    """Without `out`, the kernel operations allocate their output, and need no more memory than with it."""
+    sigma = torch.tensor([3.0])
+    expected = reference_kernels(naive_diff_gaussian_kernel, A, B, v, w, sigma=sigma)
+    A, B, v, w, sigma = cached_fix_mats(A, B, v, w, sigma, order="F", device=input_dev, dtype=np.float64)
+    expected_mm, expected_mmv, expected_dmmv = expected.to(A.dtype, A.device)
+    opt = fix_options(dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no"))
+    kernel = GaussianKernel(sigma)
+    itemsize = sizeof_dtype(A.dtype)
+    rtol, atol = rtol[A.dtype], atol[A.dtype]
+
+    with memory_checker(opt, check_cpu=False, extra_mem=A.shape[0] * B.shape[0] * itemsize) as new_opt:
+        actual = kernel(A, B, opt=new_opt)
+    torch.testing.assert_close(expected_mm, actual, rtol=rtol, atol=atol, msg="MM result is incorrect")
+
+    with memory_checker(opt, check_cpu=False, extra_mem=A.shape[0] * v.shape[1] * itemsize) as new_opt:
+        actual = kernel.mmv(A, B, v, opt=new_opt)
+    torch.testing.assert_close(expected_mmv, actual, rtol=rtol, atol=atol, msg="MMV result is incorrect")
+
+    with memory_checker(opt, check_cpu=False, extra_mem=B.shape[0] * v.shape[1] * itemsize) as new_opt:
+        actual = kernel.dmmv(A, B, v, w, opt=new_opt)
+    torch.testing.assert_close(expected_dmmv, actual, rtol=rtol, atol=atol, msg="D-MMV result is incorrect")
+
+
 @pytest.mark.parametrize("input_dev,comp_dev", device_marks)
 class TestLargeComputations:
     naive_fn = naive_diff_gaussian_kernel
     k_class = GaussianKernel
-    n = 1500
-    m = 250
-    d = 3
-    t = 2
+    n = n_large
+    m = m_large
     max_mem = 1 * 2**20
     basic_options = FalkonOptions(debug=True, compute_arch_speed=False, max_cpu_mem=max_mem, max_gpu_mem=max_mem)
     sigma = torch.Tensor([3.0])
 
     @pytest.fixture(scope="class")
-    def A(self) -> torch.Tensor:
-        return torch.from_numpy(gen_random(self.n, self.d, "float32", False, seed=92))
+    def A(self, A_large) -> torch.Tensor:
+        return A_large
 
     @pytest.fixture(scope="class")
-    def B(self) -> torch.Tensor:
-        return torch.from_numpy(gen_random(self.m, self.d, "float32", False, seed=93))
+    def B(self, B_large) -> torch.Tensor:
+        return B_large
 
     @pytest.fixture(scope="class")
-    def v(self) -> torch.Tensor:
-        return torch.from_numpy(gen_random(self.m, self.t, "float32", False, seed=94))
+    def v(self, v_large) -> torch.Tensor:
+        return v_large
 
     @pytest.fixture(scope="class")
-    def w(self) -> torch.Tensor:
-        return torch.from_numpy(gen_random(self.n, self.t, "float32", False, seed=95))
+    def w(self, w_large) -> torch.Tensor:
+        return w_large
 
     @pytest.mark.parametrize("order", ["C", "F"])
-    def test_dense_kernel(self, A, B, v, w, rtol, atol, input_dev, comp_dev, order):
-        A, B, v, w, sigma = fix_mats(A, B, v, w, self.sigma, order=order, device=input_dev, dtype=np.float32)
+    def test_dense_kernel(self, A, B, v, w, rtol, atol, input_dev, comp_dev, order, reference_kernels, scratch_pool):
+        expected = reference_kernels(TestGaussianKernel.naive_fn, A, B, v, w, sigma=self.sigma)
+        A, B, v, w, sigma = cached_fix_mats(A, B, v, w, self.sigma, order=order, device=input_dev, dtype=np.float32)
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
         run_dense_test(
             TestGaussianKernel.k_class,
@@ -568,13 +754,17 @@ class TestLargeComputations:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            expected=expected,
             sigma=sigma,
             grad_check=False,
+            check_noout=False,
         )
 
     @keops_mark
-    def test_keops_kernel(self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev):
-        A, B, v, w, sigma = fix_mats(A, B, v, w, self.sigma, order="C", device=input_dev, dtype=np.float32)
+    def test_keops_kernel(self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev, reference_kernels, scratch_pool):
+        expected = reference_kernels(TestGaussianKernel.naive_fn, A, B, v, w, sigma=self.sigma)
+        A, B, v, w, sigma = cached_fix_mats(A, B, v, w, self.sigma, order="C", device=input_dev, dtype=np.float32)
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="force")
         run_dense_test(
             TestGaussianKernel.k_class,
@@ -586,8 +776,11 @@ class TestLargeComputations:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            expected=expected,
             sigma=sigma,
             grad_check=False,
+            check_noout=False,
         )
 
 
@@ -606,23 +799,24 @@ class TestKeopsLargeD:
 
     @pytest.fixture(scope="class")
     def A(self) -> torch.Tensor:
-        return torch.from_numpy(gen_random(self.n, self.d, "float32", False, seed=92))
+        return gen_random_torch(self.n, self.d, seed=92)
 
     @pytest.fixture(scope="class")
     def B(self) -> torch.Tensor:
-        return torch.from_numpy(gen_random(self.m, self.d, "float32", False, seed=93))
+        return gen_random_torch(self.m, self.d, seed=93)
 
     @pytest.fixture(scope="class")
     def v(self) -> torch.Tensor:
-        return torch.from_numpy(gen_random(self.m, self.t, "float32", False, seed=94))
+        return gen_random_torch(self.m, self.t, seed=94)
 
     @pytest.fixture(scope="class")
     def w(self) -> torch.Tensor:
-        return torch.from_numpy(gen_random(self.n, self.t, "float32", False, seed=95))
+        return gen_random_torch(self.n, self.t, seed=95)
 
     @pytest.mark.parametrize("order", ["C", "F"])
-    def test_dense_kernel(self, A, B, v, w, rtol, atol, input_dev, comp_dev, order):
-        A, B, v, w, sigma = fix_mats(A, B, v, w, self.sigma, order=order, device=input_dev, dtype=np.float32)
+    def test_dense_kernel(self, A, B, v, w, rtol, atol, input_dev, comp_dev, order, reference_kernels, scratch_pool):
+        expected = reference_kernels(TestGaussianKernel.naive_fn, A, B, v, w, sigma=self.sigma)
+        A, B, v, w, sigma = cached_fix_mats(A, B, v, w, self.sigma, order=order, device=input_dev, dtype=np.float32)
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
         run_dense_test(
             TestGaussianKernel.k_class,
@@ -634,13 +828,17 @@ class TestKeopsLargeD:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            expected=expected,
             sigma=sigma,
             grad_check=False,
+            check_noout=False,
         )
 
     @keops_mark
-    def test_keops_kernel(self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev):
-        A, B, v, w, sigma = fix_mats(A, B, v, w, self.sigma, order="C", device=input_dev, dtype=np.float32)
+    def test_keops_kernel(self, A, B, v, w, sigma, rtol, atol, input_dev, comp_dev, reference_kernels, scratch_pool):
+        expected = reference_kernels(TestGaussianKernel.naive_fn, A, B, v, w, sigma=self.sigma)
+        A, B, v, w, sigma = cached_fix_mats(A, B, v, w, self.sigma, order="C", device=input_dev, dtype=np.float32)
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="force")
         run_dense_test(
             TestGaussianKernel.k_class,
@@ -652,8 +850,11 @@ class TestKeopsLargeD:
             rtol=rtol[A.dtype],
             atol=atol[A.dtype],
             opt=opt,
+            scratch_pool=scratch_pool,
+            expected=expected,
             sigma=sigma,
             grad_check=False,
+            check_noout=False,
         )
 
 
@@ -671,10 +872,10 @@ class TestBenchmark:
     @pytest.mark.parametrize("d", [1, 10, 100])
     @pytest.mark.parametrize("t", [1, 10, 100])
     def test_dense_kernel(self, n, m, d, t, order, dev):
-        A = torch.from_numpy(gen_random(n, d, "float32", F=False, seed=92))
-        B = torch.from_numpy(gen_random(m, d, "float32", F=False, seed=93))
-        v = torch.from_numpy(gen_random(m, t, "float32", F=False, seed=94))
-        w = torch.from_numpy(gen_random(n, t, "float32", F=False, seed=95))
+        A = gen_random_torch(n, d, seed=92)
+        B = gen_random_torch(m, d, seed=93)
+        v = gen_random_torch(m, t, seed=94)
+        w = gen_random_torch(n, t, seed=95)
         A, B, v, w, sigma = fix_mats(A, B, v, w, self.sigma, order=order, device=dev, dtype=np.float32)
         opt = dataclasses.replace(self.basic_options, keops_active="no")
         kernel = self.k_class(sigma, opt)
@@ -1,4 +1,6 @@
 import dataclasses
+import logging
+from typing import Optional
 
 import numpy as np
 import pytest
@@ -7,7 +9,8 @@ import torch
 from falkon.kernels import GaussianKernel, LaplacianKernel, MaternKernel, PolynomialKernel
 from falkon.mmv_ops.utils import CUDA_EXTRA_MM_RAM
 from falkon.options import FalkonOptions
-from falkon.tests.conftest import fix_mats, memory_checker
+from falkon.sparse import SparseTensor
+from falkon.tests.conftest import KernelReferences, assert_all_close, cached_fix_mats, memory_checker
 from falkon.tests.gen_random import gen_random, gen_sparse_matrix
 from falkon.tests.naive_kernels import (
     naive_diff_gaussian_kernel,
@@ -19,6 +22,7 @@ from falkon.utils import decide_cuda
 from falkon.utils.helpers import sizeof_dtype
 from falkon.utils.switches import decide_keops
 
+log = logging.getLogger(__name__)
 cuda_mark = pytest.mark.skipif(not decide_cuda(), reason="No GPU found.")
 keops_mark = pytest.mark.skipif(not decide_keops(), reason="no KeOps found.")
 device_marks = [
@@ -37,37 +41,47 @@ device_marks = [
         ],
     ),
 ]
-# Sparse data dimensions
+# Sparse data dimensions. About 100 non-zeros per matrix, with a small dense mirror.
 n = 500
 m = 550
-d = 20000
+d = 2000
 t = 2
-density = 1e-5
+density = 1e-4
 
 max_mem = 2 * 2**20
 basic_options = FalkonOptions(debug=True, compute_arch_speed=False, max_cpu_mem=max_mem, max_gpu_mem=max_mem)
 
 
-@pytest.fixture(scope="module")
-def s_A():
-    A = gen_sparse_matrix(n, d, np.float64, density=density, seed=14)
-    Ad = torch.from_numpy(A.to_scipy().todense())
-    return A, Ad
+@dataclasses.dataclass
+class SparseData:
+    """A sparse matrix, with a dense copy which is only built when first needed."""
 
+    sparse: SparseTensor
+    _dense: Optional[torch.Tensor] = None
 
-@pytest.fixture(scope="module")
-def s_B():
-    B = gen_sparse_matrix(m, d, np.float64, density=density, seed=14)
-    Bd = torch.from_numpy(B.to_scipy().todense())
-    return B, Bd
+    @property
+    def dense(self) -> torch.Tensor:
+        if self._dense is None:
+            self._dense = torch.from_numpy(self.sparse.to_scipy().todense())
+        return self._dense
 
 
-@pytest.fixture(scope="module")
+@pytest.fixture(scope="session")
+def s_A() -> SparseData:
+    return SparseData(gen_sparse_matrix(n, d, np.float64, density=density, seed=14))
+
+
+@pytest.fixture(scope="session")
+def s_B() -> SparseData:
+    return SparseData(gen_sparse_matrix(m, d, np.float64, density=density, seed=14))
+
+
+@pytest.fixture(scope="session")
 def v() -> torch.Tensor:
     return torch.from_numpy(gen_random(m, t, "float32", False, seed=94))
 
 
-@pytest.fixture(scope="module")
+@pytest.fixture(scope="session")
 def w() -> torch.Tensor:
     return torch.from_numpy(gen_random(n, t, "float32", False, seed=95))
 
@@ -111,65 +125,64 @@ def fix_options(opt):
     )
 
 
-def run_sparse_test(k_cls, naive_fn, s_m1, s_m2, m1, m2, v, w, rtol, atol, opt, **kernel_params):
+def run_sparse_test(k_cls, s_m1, s_m2, v, w, rtol, atol, opt, expected: KernelReferences, **kernel_params):
     kernel = k_cls(**kernel_params)
     opt = fix_options(opt)
-    print(f"max mem: {opt.max_gpu_mem}")
+    log.debug("max mem: %s", opt.max_gpu_mem)
+    expected_mm, expected_mmv, expected_dmmv = expected.to(s_m1.dtype, s_m1.device)
 
     # 1. MM
     mm_out = torch.empty(s_m2.shape[0], s_m1.shape[0], dtype=s_m1.dtype, device=s_m1.device).T
     with memory_checker(opt) as new_opt:
         actual = kernel(s_m1, s_m2, out=mm_out, opt=new_opt)
-    with memory_checker(opt, extra_mem=m1.shape[0] * m2.shape[0] * sizeof_dtype(m1.dtype)) as new_opt:
+    with memory_checker(opt, extra_mem=s_m1.shape[0] * s_m2.shape[0] * sizeof_dtype(s_m1.dtype)) as new_opt:
         actual_noout = kernel(s_m1, s_m2, opt=new_opt)
     assert mm_out.data_ptr() == actual.data_ptr(), "sparse MM Output data tensor was not used"
-    torch.testing.assert_close(
-        actual_noout, actual, rtol=rtol, atol=atol, msg="sparse MM with out and without return different stuff"
-    )
-    expected_mm = naive_fn(m1, m2, **kernel_params)
-    torch.testing.assert_close(expected_mm, actual, rtol=rtol, atol=atol, msg="sparse MM result is incorrect")
+    checks = {
+        "sparse MM with out and without return different stuff": actual_noout,
+        "sparse MM result is incorrect": expected_mm,
+    }
+    assert_all_close(actual, checks, rtol=rtol, atol=atol)
 
     # 2. MMV
     mmv_out = torch.empty(s_m1.shape[0], v.shape[1], dtype=s_m1.dtype, device=s_m1.device)
     with memory_checker(opt) as new_opt:
         actual = kernel.mmv(s_m1, s_m2, v, out=mmv_out, opt=new_opt)
-    with memory_checker(opt, extra_mem=m1.shape[0] * v.shape[1] * sizeof_dtype(m1.dtype)) as new_opt:
+    with memory_checker(opt, extra_mem=s_m1.shape[0] * v.shape[1] * sizeof_dtype(s_m1.dtype)) as new_opt:
         actual_noout = kernel.mmv(s_m1, s_m2, v, opt=new_opt)
     assert mmv_out.data_ptr() == actual.data_ptr(), "sparse MMV Output data tensor was not used"
-    torch.testing.assert_close(
-        actual_noout, actual, rtol=rtol, atol=atol, msg="sparse MMV with out and without return different stuff"
-    )
-    expected_mmv = expected_mm @ v
-    torch.testing.assert_close(expected_mmv, actual, rtol=rtol, atol=atol, msg="sparse MMV result is incorrect")
+    checks = {
+        "sparse MMV with out and without return different stuff": actual_noout,
+        "sparse MMV result is incorrect": expected_mmv,
+    }
+    assert_all_close(actual, checks, rtol=rtol, atol=atol)
 
     # 3. dMMV
     dmmv_out = torch.empty(s_m2.shape[0], v.shape[1], dtype=s_m2.dtype, device=s_m2.device)
     with memory_checker(opt) as new_opt:
         actual = kernel.dmmv(s_m1, s_m2, v, w, out=dmmv_out, opt=new_opt)
-    with memory_checker(opt, extra_mem=m2.shape[0] * v.shape[1] * sizeof_dtype(m1.dtype)) as new_opt:
+    with memory_checker(opt, extra_mem=s_m2.shape[0] * v.shape[1] * sizeof_dtype(s_m1.dtype)) as new_opt:
         actual_noout = kernel.dmmv(s_m1, s_m2, v, w, opt=new_opt)
     assert dmmv_out.data_ptr() == actual.data_ptr(), "sparse D-MMV Output data tensor was not used"
-    torch.testing.assert_close(
-        actual_noout, actual, rtol=rtol, atol=atol, msg="sparse D-MMV with out and without return different stuff"
-    )
-    expected_dmmv = expected_mm.T @ (expected_mmv + w)
-    torch.testing.assert_close(expected_dmmv, actual, rtol=rtol, atol=atol, msg="sparse D-MMV result is incorrect")
+    checks = {
+        "sparse D-MMV with out and without return different stuff": actual_noout,
+        "sparse D-MMV result is incorrect": expected_dmmv,
+    }
+    assert_all_close(actual, checks, rtol=rtol, atol=atol)
 
 
-def run_sparse_test_wsigma(k_cls, naive_fn, s_m1, s_m2, m1, m2, v, w, rtol, atol, opt, sigma, **kernel_params):
+def run_sparse_test_wsigma(k_cls, s_m1, s_m2, v, w, rtol, atol, opt, sigma, expected, **kernel_params):
     try:
         run_sparse_test(
             k_cls,
-            naive_fn,
             s_m1=s_m1,
             s_m2=s_m2,
-            m1=m1,
-            m2=m2,
             v=v,
             w=w,
             rtol=rtol,
             atol=atol,
             opt=opt,
+            expected=expected,
             sigma=sigma,
             **kernel_params,
         )
@@ -185,25 +198,22 @@ class TestLaplacianKernel:
     naive_fn = naive_diff_laplacian_kernel
     k_class = LaplacianKernel
 
-    def test_sparse_kernel(self, s_A, s_B, v, w, sigma, rtol, atol, input_dev, comp_dev):
-        s_A, d_A = s_A
-        s_B, d_B = s_B
-        s_A, A, s_B, B, v, w, sigma = fix_mats(
-            s_A, d_A, s_B, d_B, v, w, sigma, order="C", device=input_dev, dtype=np.float32
+    def test_sparse_kernel(self, s_A, s_B, v, w, sigma, rtol, atol, input_dev, comp_dev, reference_kernels):
+        expected = reference_kernels(TestLaplacianKernel.naive_fn, s_A.dense, s_B.dense, v, w, sigma=sigma)
+        s_A, s_B, v, w, sigma = cached_fix_mats(
+            s_A.sparse, s_B.sparse, v, w, sigma, order="C", device=input_dev, dtype=np.float32
         )
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
         run_sparse_test_wsigma(
             TestLaplacianKernel.k_class,
-            TestLaplacianKernel.naive_fn,
             s_m1=s_A,
             s_m2=s_B,
-            m1=A,
-            m2=B,
             v=v,
             w=w,
-            rtol=rtol[A.dtype],
-            atol=atol[A.dtype],
+            rtol=rtol[s_A.dtype],
+            atol=atol[s_A.dtype],
             opt=opt,
+            expected=expected,
             sigma=sigma,
         )
 
@@ -213,25 +223,22 @@ class TestGaussianKernel:
     naive_fn = naive_diff_gaussian_kernel
     k_class = GaussianKernel
 
-    def test_sparse_kernel(self, s_A, s_B, v, w, sigma, rtol, atol, input_dev, comp_dev):
-        s_A, d_A = s_A
-        s_B, d_B = s_B
-        s_A, A, s_B, B, v, w, sigma = fix_mats(
-            s_A, d_A, s_B, d_B, v, w, sigma, order="C", device=input_dev, dtype=np.float32
+    def test_sparse_kernel(self, s_A, s_B, v, w, sigma, rtol, atol, input_dev, comp_dev, reference_kernels):
+        expected = reference_kernels(TestGaussianKernel.naive_fn, s_A.dense, s_B.dense, v, w, sigma=sigma)
+        s_A, s_B, v, w, sigma = cached_fix_mats(
+            s_A.sparse, s_B.sparse, v, w, sigma, order="C", device=input_dev, dtype=np.float32
         )
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
         run_sparse_test_wsigma(
             TestGaussianKernel.k_class,
-            TestGaussianKernel.naive_fn,
             s_m1=s_A,
             s_m2=s_B,
-            m1=A,
-            m2=B,
             v=v,
             w=w,
-            rtol=rtol[A.dtype],
-            atol=atol[A.dtype],
+            rtol=rtol[s_A.dtype],
+            atol=atol[s_A.dtype],
             opt=opt,
+            expected=expected,
             sigma=sigma,
         )
 
@@ -245,25 +252,22 @@ class TestMaternKernel:
     def nu(self, request) -> torch.Tensor:
         return torch.tensor(request.param)
 
-    def test_sparse_kernel(self, s_A, s_B, v, w, sigma, nu, rtol, atol, input_dev, comp_dev):
-        s_A, d_A = s_A
-        s_B, d_B = s_B
-        s_A, A, s_B, B, v, w, sigma = fix_mats(
-            s_A, d_A, s_B, d_B, v, w, sigma, order="C", device=input_dev, dtype=np.float32
+    def test_sparse_kernel(self, s_A, s_B, v, w, sigma, nu, rtol, atol, input_dev, comp_dev, reference_kernels):
+        expected = reference_kernels(TestMaternKernel.naive_fn, s_A.dense, s_B.dense, v, w, sigma=sigma, nu=nu)
+        s_A, s_B, v, w, sigma = cached_fix_mats(
+            s_A.sparse, s_B.sparse, v, w, sigma, order="C", device=input_dev, dtype=np.float32
         )
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
         run_sparse_test_wsigma(
             TestMaternKernel.k_class,
-            TestMaternKernel.naive_fn,
             s_m1=s_A,
             s_m2=s_B,
-            m1=A,
-            m2=B,
             v=v,
             w=w,
-            rtol=rtol[A.dtype],
-            atol=atol[A.dtype],
+            rtol=rtol[s_A.dtype],
+            atol=atol[s_A.dtype],
             opt=opt,
+            expected=expected,
             sigma=sigma,
             nu=nu,
         )
@@ -277,26 +281,41 @@ class TestPolynomialKernel:
     gamma = torch.tensor(2.0)
     degree = torch.tensor(1.5)
 
-    def test_sparse_kernel(self, s_A, s_B, v, w, rtol, atol, input_dev, comp_dev):
-        s_A, d_A = s_A
-        s_B, d_B = s_B
-        s_A, A, s_B, B, v, w, beta, gamma, degree = fix_mats(
-            s_A, d_A, s_B, d_B, v, w, self.beta, self.gamma, self.degree, order="C", device=input_dev, dtype=np.float32
+    def test_sparse_kernel(self, s_A, s_B, v, w, rtol, atol, input_dev, comp_dev, reference_kernels):
+        expected = reference_kernels(
+            TestPolynomialKernel.naive_fn,
+            s_A.dense,
+            s_B.dense,
+            v,
+            w,
+            beta=self.beta,
+            gamma=self.gamma,
+            degree=self.degree,
+        )
+        s_A, s_B, v, w, beta, gamma, degree = cached_fix_mats(
+            s_A.sparse,
+            s_B.sparse,
+            v,
+            w,
+            self.beta,
+            self.gamma,
+            self.degree,
+            order="C",
+            device=input_dev,
+            dtype=np.float32,
         )
         opt = dataclasses.replace(basic_options, use_cpu=comp_dev == "cpu", keops_active="no")
         try:
             run_sparse_test(
                 TestPolynomialKernel.k_class,
-                TestPolynomialKernel.naive_fn,
                 s_m1=s_A,
                 s_m2=s_B,
-                m1=A,
-                m2=B,
                 v=v,
                 w=w,
-                rtol=rtol[A.dtype],
-                atol=atol[A.dtype],
+                rtol=rtol[s_A.dtype],
+                atol=atol[s_A.dtype],
                 opt=opt,
+                expected=expected,
                 beta=beta,
                 gamma=gamma,
                 degree=degree,
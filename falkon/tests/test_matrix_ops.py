@@ -1,17 +1,53 @@
 import time
-from functools import partial
+from functools import lru_cache, partial
 
 import numpy as np
 import pytest
 import scipy
 import torch
 
-from falkon.c_ext import copy_transpose
-from falkon.la_helpers import copy_triang, mul_triang, potrf, square_norm, trsm, vec_mul_triang, zero_triang
-from falkon.tests.conftest import fix_mat
+from falkon.c_ext import copy_transpose, copy_triang_transpose
+from falkon.la_helpers import (
+    copy_triang,
+    mul_triang,
+    potrf,
+    potrf_batched,
+    square_norm,
+    trsm,
+    vec_mul_triang,
+    zero_triang,
+)
+from falkon.la_helpers import cpu_potrf
+from falkon.la_helpers.cpu_potrf import _has_mm_out_dtype, _syrk_lower_bf16
+from falkon.tests.conftest import fix_mat, numpy_to_torch_type
 from falkon.tests.gen_random import gen_random, gen_random_pd
 from falkon.utils import decide_cuda
-from falkon.utils.tensor_helpers import create_same_stride, move_tensor
+from falkon.utils.tensor_helpers import move_tensor
+
+
+@lru_cache(maxsize=32)
+def _triu_mask(t: int, k: int) -> torch.Tensor:
+    """Boolean mask of the upper triangle (from the `k`-th diagonal) of a `t*t` matrix. Do not modify."""
+    return torch.ones(t, t, dtype=torch.bool).triu_(k)
+
+
+@lru_cache(maxsize=32)
+def _tril_mask(t: int, k: int) -> torch.Tensor:
+    """Boolean mask of the lower triangle (up to the `k`-th diagonal) of a `t*t` matrix. Do not modify."""
+    return torch.ones(t, t, dtype=torch.bool).tril_(k)
+
+
+def prepare_input(mat: np.ndarray, order: str, dtype, device) -> torch.Tensor:
+    """Build a `device` tensor with the given dtype and memory order, using at most one copy per device.
+
+    The output never shares memory with `mat`, so tests may modify it in-place.
+    """
+    if str(device) == "cpu":
+        mat = np.array(mat, dtype=dtype, order=order, copy=True)
+    else:
+        # The host -> device transfer already produces a fresh copy.
+        mat = np.asarray(mat, dtype=dtype, order=order)
+    return move_tensor(torch.from_numpy(mat), device)
 
 
 @pytest.mark.skipif(not decide_cuda(), reason="No GPU found.")
@@ -28,17 +64,23 @@ class TestCopyTranspose:
     def rect(self):
         return gen_random(self.t, self.t * 2 - 1, np.float64, F=True, seed=12345)
 
-    def test_square(self, mat, order, dtype):
+    @pytest.fixture(scope="class")
+    def stream(self):
+        return torch.cuda.Stream()
+
+    def test_square(self, mat, order, dtype, stream):
         mat = fix_mat(mat, order=order, dtype=dtype, copy=True, numpy=True)
-        mat_out = np.copy(mat, order="K")
         exp_mat_out = np.copy(mat.T, order=order)
 
-        mat = move_tensor(torch.from_numpy(mat), "cuda:0")
-        mat_out = move_tensor(torch.from_numpy(mat_out), "cuda:0")
+        # All device work (H2D, transpose, D2H) is queued on a side stream. The final
+        # (blocking) readback is the only synchronization point.
+        with torch.cuda.stream(stream):
+            mat = torch.from_numpy(mat).pin_memory().to("cuda:0", non_blocking=True)
+            mat_out = torch.empty_strided(mat.shape, mat.stride(), dtype=mat.dtype, device=mat.device)
 
-        copy_transpose(mat, out=mat_out)
+            copy_transpose(mat, out=mat_out)
 
-        mat_out = move_tensor(mat_out, "cpu").numpy()
+            mat_out = move_tensor(mat_out, "cpu").numpy()
         assert mat_out.strides == exp_mat_out.strides
         np.testing.assert_allclose(exp_mat_out, mat_out)
 
@@ -57,6 +99,37 @@ class TestCopyTranspose:
         np.testing.assert_allclose(exp_mat_out, mat_out)
 
 
+@pytest.mark.skipif(not decide_cuda(), reason="No GPU found.")
+@pytest.mark.parametrize("upper", [True, False], ids=["upper", "lower"])
+@pytest.mark.parametrize("order", ["F", "C"])
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+class TestCopyTriangTranspose:
+    t = 70
+
+    @pytest.fixture(scope="class")
+    def mat(self):
+        # Exactly representable with both dtypes, so results can be compared against `mat` directly.
+        return gen_random(self.t, self.t, np.float32, F=True, seed=12345)
+
+    def test_square(self, mat, upper, order, dtype):
+        tri_mat = np.triu(mat) if upper else np.tril(mat)
+        exp_mat_out = tri_mat + tri_mat.T - np.diag(np.diag(mat))
+
+        mat_dev = prepare_input(mat, order, dtype, "cuda:0")
+        mat_out = torch.zeros_like(mat_dev)
+
+        copy_triang_transpose(mat_dev, out=mat_out, upper=upper)
+
+        np.testing.assert_allclose(exp_mat_out, mat_out.cpu().numpy())
+        # The input is not modified
+        np.testing.assert_array_equal(mat, mat_dev.cpu().numpy())
+
+    def test_inplace(self, mat, upper, order, dtype):
+        mat_dev = prepare_input(mat, order, dtype, "cuda:0")
+        with pytest.raises(RuntimeError, match="must not share memory"):
+            copy_triang_transpose(mat_dev, out=mat_dev, upper=upper)
+
+
 @pytest.mark.parametrize("order", ["F", "C"])
 @pytest.mark.parametrize("dtype", [np.float32, np.float64])
 @pytest.mark.parametrize(
@@ -128,17 +201,13 @@ class TestCopyTriang:
 
     @pytest.fixture(scope="class")
     def mat(self):
-        return np.random.random((self.t, self.t))
+        # float32 values: the exact comparisons below hold for both dtypes without casting `mat`.
+        return gen_random(self.t, self.t, np.float32, F=False, seed=12345)
 
     def test_low(self, mat, order, dtype, device):
-        mat = fix_mat(mat, order=order, dtype=dtype, numpy=True)
-        mat_low = mat.copy(order="K")
+        mat_low_dev = prepare_input(mat, order, dtype, device)
         # Upper triangle of mat_low is 0
-        mat_low[np.triu_indices(self.t, 1)] = 0
-
-        # Create device matrix
-        mat_low = torch.from_numpy(mat_low)
-        mat_low_dev = move_tensor(mat_low, device)
+        mat_low_dev.tril_()
 
         # Run copy
         copy_triang(mat_low_dev, upper=False)
@@ -151,8 +220,7 @@ class TestCopyTriang:
         np.testing.assert_array_equal(np.diag(mat), np.diag(mat_low))
 
         # Reset and try with `upper=True`
-        mat_low[np.triu_indices(self.t, 1)] = 0
-        mat_low_dev.copy_(torch.from_numpy(mat_low))
+        mat_low_dev.tril_()
 
         copy_triang(mat_low_dev, upper=True)  # Only the diagonal will be set
 
@@ -160,13 +228,9 @@ class TestCopyTriang:
         np.testing.assert_array_equal(np.diag(mat), np.diag(mat_low))
 
     def test_up(self, mat, order, dtype, device):
-        mat = fix_mat(mat, order=order, dtype=dtype, numpy=True)
-        mat_up = mat.copy(order="K")
+        mat_up_dev = prepare_input(mat, order, dtype, device)
         # Lower triangle of mat_up is 0
-        mat_up[np.tril_indices(self.t, -1)] = 0
-        # Create device matrix
-        mat_up = torch.from_numpy(mat_up)
-        mat_up_dev = move_tensor(mat_up, device)
+        mat_up_dev.triu_()
 
         copy_triang(mat_up_dev, upper=True)
         mat_up = mat_up_dev.cpu().numpy()
@@ -177,8 +241,7 @@ class TestCopyTriang:
         np.testing.assert_array_equal(np.diag(mat), np.diag(mat_up))
 
         # Reset and try with `upper=False`
-        mat_up[np.tril_indices(self.t, -1)] = 0
-        mat_up_dev.copy_(torch.from_numpy(mat_up))
+        mat_up_dev.triu_()
 
         copy_triang(mat_up_dev, upper=False)  # Only the diagonal will be set.
 
@@ -200,11 +263,13 @@ class TestPotrf:
 
     @pytest.fixture(scope="class")
     def exp_lower(self, mat):
-        return torch.linalg.cholesky(mat)
+        # Computed once, and cast once to every tested dtype.
+        chol = torch.linalg.cholesky(mat)
+        return {dtype: chol.to(dtype=numpy_to_torch_type(dtype)) for dtype in self.rtol}
 
     @pytest.fixture(scope="class")
     def exp_upper(self, exp_lower):
-        return exp_lower.T
+        return {dtype: chol.T for dtype, chol in exp_lower.items()}
 
     def test_upper(self, mat, exp_upper, clean, overwrite, order, dtype):
         mat = fix_mat(mat, order=order, dtype=dtype, copy=False, numpy=False)
@@ -216,12 +281,10 @@ class TestPotrf:
             assert inpt.data_ptr() == our_chol.data_ptr(), "Overwriting failed"
 
         if clean:
-            torch.testing.assert_close(exp_upper.to(our_chol.dtype), our_chol, rtol=self.rtol[dtype], atol=0)
+            torch.testing.assert_close(exp_upper[dtype], our_chol, rtol=self.rtol[dtype], atol=0)
             assert torch.tril(our_chol, -1).sum() == 0
         else:
-            torch.testing.assert_close(
-                exp_upper.to(our_chol.dtype), torch.triu(our_chol), rtol=self.rtol[dtype], atol=0
-            )
+            torch.testing.assert_close(exp_upper[dtype], torch.triu(our_chol), rtol=self.rtol[dtype], atol=0)
             torch.testing.assert_close(torch.tril(mat, -1), torch.tril(our_chol, -1))
 
     def test_lower(self, mat, exp_lower, clean, overwrite, order, dtype):
@@ -234,29 +297,114 @@ class TestPotrf:
             assert inpt.data_ptr() == our_chol.data_ptr(), "Overwriting failed"
 
         if clean:
-            torch.testing.assert_close(exp_lower.to(our_chol.dtype), our_chol, rtol=self.rtol[dtype], atol=0)
+            torch.testing.assert_close(exp_lower[dtype], our_chol, rtol=self.rtol[dtype], atol=0)
             assert torch.triu(our_chol, 1).sum() == 0
         else:
-            np.testing.assert_allclose(
-                exp_lower.to(our_chol.dtype), torch.tril(our_chol), rtol=self.rtol[dtype], atol=0
-            )
+            np.testing.assert_allclose(exp_lower[dtype], torch.tril(our_chol), rtol=self.rtol[dtype], atol=0)
             np.testing.assert_allclose(torch.triu(mat, 1), torch.triu(our_chol, 1))
 
 
+@pytest.mark.parametrize("clean", [True, False], ids=["clean", "dirty"])
+@pytest.mark.parametrize("overwrite", [True, False], ids=["overwrite", "copy"])
+@pytest.mark.parametrize("upper", [True, False], ids=["upper", "lower"])
+def test_potrf_batched(clean, overwrite, upper):
+    if upper:
+        tri_fn, other_tri_fn = torch.triu, partial(torch.tril, diagonal=-1)
+    else:
+        tri_fn, other_tri_fn = torch.tril, partial(torch.triu, diagonal=1)
+
+    # All size/order/dtype combinations are factorized with a single call
+    sizes = [TestPotrf.t, TestPotrf.t // 2 + 1]
+    cases = [(t, order, dtype) for t in sizes for order in ["F", "C"] for dtype in [np.float32, np.float64]]
+    pd_mats = {t: gen_random_pd(t, np.float64, F=True, seed=12345) for t in sizes}
+    exp_chols = {t: torch.linalg.cholesky(pd_mat) for t, pd_mat in pd_mats.items()}
+    mats = [fix_mat(pd_mats[t], order=order, dtype=dtype, copy=True) for t, order, dtype in cases]
+    inpts = [m.clone() for m in mats]
+
+    our_chols = potrf_batched(inpts, upper=upper, clean=clean, overwrite=overwrite)
+    assert len(our_chols) == len(mats)
+    for (t, _, dtype), m, inpt, our_chol in zip(cases, mats, inpts, our_chols):
+        exp_chol = exp_chols[t].T if upper else exp_chols[t]
+        assert our_chol.stride() == m.stride()
+        if overwrite:
+            assert our_chol is inpt, "Overwriting failed"
+        else:
+            torch.testing.assert_close(inpt, m, rtol=0, atol=0)
+        rtol = TestPotrf.rtol[dtype]
+        torch.testing.assert_close(exp_chol.to(our_chol.dtype), tri_fn(our_chol), rtol=rtol, atol=0)
+        if clean:
+            assert other_tri_fn(our_chol).sum() == 0
+        else:
+            torch.testing.assert_close(other_tri_fn(m), other_tri_fn(our_chol))
+
+
+@pytest.mark.parametrize("upper", [True, False], ids=["upper", "lower"])
+@pytest.mark.parametrize("order", ["F", "C"])
+def test_potrf_mixed_precision(upper, order):
+    t = 700  # Larger than the block-size, so that trailing updates are exercised
+    mat = fix_mat(gen_random_pd(t, np.float64, F=True, seed=12345), order=order, dtype=np.float32)
+    inpt = mat.clone()
+
+    our_chol = potrf(inpt, upper=upper, clean=True, overwrite=True, cuda=False, mixed_precision=True)
+    assert inpt.data_ptr() == our_chol.data_ptr(), "Overwriting failed"
+    assert our_chol.stride() == mat.stride()
+    if upper:
+        assert torch.tril(our_chol, -1).sum() == 0
+        recon = our_chol.T @ our_chol
+    else:
+        assert torch.triu(our_chol, 1).sum() == 0
+        recon = our_chol @ our_chol.T
+    # Rounding the panels to bfloat16 limits the accuracy (see the test below for the accumulation)
+    assert torch.linalg.norm(recon - mat) / torch.linalg.norm(mat) < 1e-2
+
+
+@pytest.mark.skipif(not _has_mm_out_dtype(), reason="torch.mm does not support out_dtype")
+def test_potrf_mixed_precision_accumulation():
+    # All entries of `P` are exact in bfloat16, and all partial sums of the update are exact in
+    # float32: the result is only exact if the products are accumulated (and returned) in float32.
+    gen = torch.Generator().manual_seed(12)
+    P = torch.randint(-64, 65, (600, 300), generator=gen).to(dtype=torch.float32) / 64
+    C = torch.full((600, 600), 2.0, dtype=torch.float32)
+    _syrk_lower_bf16(C, P, block_size=256)
+
+    P64 = P.to(dtype=torch.float64)
+    expected = torch.full((600, 600), 2.0, dtype=torch.float64) - torch.tril(P64 @ P64.T)
+    torch.testing.assert_close(C.to(dtype=torch.float64), expected, rtol=0, atol=0)
+
+
+def test_potrf_mixed_precision_fallback(monkeypatch):
+    monkeypatch.setattr(cpu_potrf, "_has_mm_out_dtype", lambda: False)
+    mat = fix_mat(gen_random_pd(700, np.float64, F=True, seed=12345), order="F", dtype=np.float32)
+    exp_chol = potrf(mat.clone(), upper=False, clean=True, overwrite=True, cuda=False, mixed_precision=False)
+
+    inpt = mat.clone()
+    with pytest.warns(UserWarning, match="full-precision"):
+        our_chol = potrf(inpt, upper=False, clean=True, overwrite=True, cuda=False, mixed_precision=True)
+    assert inpt.data_ptr() == our_chol.data_ptr(), "Overwriting failed"
+    # Without bfloat16 support the LAPACK routine is used, so there is no loss of accuracy.
+    torch.testing.assert_close(our_chol, exp_chol, rtol=0, atol=0)
+
+
 @pytest.mark.benchmark
 def test_potrf_speed():
     t = 5000
     mat = gen_random_pd(t, np.float32, F=False, seed=12345)
+    # Both implementations factorize a pre-copied buffer in-place, so that copies are not timed.
+    our_inpt = mat.clone()
+    lapack_inpt = np.empty_like(mat.numpy(), order="F")
+    lapack_inpt[:] = mat.numpy()
+
     t_s = time.time()
-    our_chol = potrf(mat, upper=False, clean=True, overwrite=False, cuda=False)
+    our_chol = potrf(our_inpt, upper=False, clean=True, overwrite=True, cuda=False, mixed_precision=False)
     our_time = time.time() - t_s
 
     t_s = time.time()
-    np_chol = np.linalg.cholesky(mat)
-    np_time = time.time() - t_s
+    lapack_chol, info = scipy.linalg.lapack.spotrf(lapack_inpt, lower=1, clean=1, overwrite_a=1)
+    lapack_time = time.time() - t_s
+    assert info == 0, f"LAPACK spotrf failed with status {info}"
 
-    np.testing.assert_allclose(np_chol, our_chol, rtol=1e-5)
-    print("Time for cholesky(%d): Numpy %.2fs - Our %.2fs" % (t, np_time, our_time))
+    np.testing.assert_allclose(lapack_chol, our_chol, rtol=1e-5)
+    print("Time for cholesky(%d): LAPACK %.2fs - Our %.2fs" % (t, lapack_time, our_time))
 
 
 @pytest.mark.parametrize("preserve_diag", [True, False], ids=["preserve", "no-preserve"])
@@ -273,8 +421,8 @@ class TestMulTriang:
         return gen_random(self.t, self.t, np.float32, F=False, seed=123)
 
     def test_zero(self, mat, upper, preserve_diag, order, device):
-        inpt1 = fix_mat(mat, dtype=mat.dtype, order=order, copy=True, numpy=True)
-        inpt2 = inpt1.copy(order="K")
+        inpt1_dev = prepare_input(mat, order, mat.dtype, device)
+        inpt2_dev = inpt1_dev.clone() if preserve_diag else None
 
         k = 1 if preserve_diag else 0
         if upper:
@@ -282,23 +430,18 @@ class TestMulTriang:
         else:
             tri_fn = partial(np.tril, k=-k)
 
-        inpt1 = torch.from_numpy(inpt1)
-        inpt1_dev = create_same_stride(inpt1.shape, inpt1, inpt1.dtype, device)
-        inpt1_dev.copy_(inpt1)
         mul_triang(inpt1_dev, upper=upper, preserve_diag=preserve_diag, multiplier=0)
         inpt1 = inpt1_dev.cpu().numpy()
 
         assert np.sum(tri_fn(inpt1)) == 0
 
         if preserve_diag:
-            inpt2_dev = inpt1_dev
-            inpt2_dev.copy_(torch.from_numpy(inpt2))
             zero_triang(inpt2_dev, upper=upper)
             inpt2 = inpt2_dev.cpu().numpy()
             np.testing.assert_allclose(inpt1, inpt2)
 
     def test_mul(self, mat, upper, preserve_diag, order, device):
-        inpt1 = fix_mat(mat, dtype=mat.dtype, order=order, copy=True, numpy=True)
+        inpt1_dev = prepare_input(mat, order, mat.dtype, device)
 
         k = 1 if preserve_diag else 0
         if upper:
@@ -308,9 +451,6 @@ class TestMulTriang:
             tri_fn = partial(np.tril, k=-k)
             other_tri_fn = partial(np.triu, k=-k + 1)
 
-        inpt1 = torch.from_numpy(inpt1)
-        inpt1_dev = create_same_stride(inpt1.shape, inpt1, inpt1.dtype, device)
-        inpt1_dev.copy_(inpt1)
         mul_triang(inpt1_dev, upper=upper, preserve_diag=preserve_diag, multiplier=10**6)
         inpt1 = inpt1_dev.cpu().numpy()
 
@@ -363,19 +503,18 @@ class TestTrsm:
     )
     def solution(self, mat, vec, request):
         lower, trans = request.param
-        return (
-            scipy.linalg.solve_triangular(
-                mat, vec, trans=int(trans), lower=lower, unit_diagonal=False, overwrite_b=False, check_finite=True
-            ),
-            lower,
-            trans,
+        sol = scipy.linalg.solve_triangular(
+            mat, vec, trans=int(trans), lower=lower, unit_diagonal=False, overwrite_b=False, check_finite=True
         )
+        # Cast once to every tested dtype.
+        return {dtype: sol.astype(dtype) for dtype in self.rtol}, lower, trans
 
     def test_trsm(self, mat, vec, solution, alpha, dtype, order_v, order_A, device):
         mat = move_tensor(fix_mat(mat, dtype, order_A, copy=True, numpy=False), device=device)
         vec = move_tensor(fix_mat(vec, dtype, order_v, copy=True, numpy=False), device=device)
 
-        sol_vec, lower, trans = solution
+        sol_vecs, lower, trans = solution
+        sol_vec = sol_vecs[dtype]
         out = trsm(vec, mat, alpha, lower=int(lower), transpose=int(trans))
 
         assert out.data_ptr() != vec.data_ptr(), "Vec was overwritten."
@@ -403,15 +542,10 @@ class TestVecMulTriang:
         else:
             vec = vec.reshape(1, -1)
         if upper:
-            tri_mat = torch.triu(mat, diagonal=0)
-            tri_idx = torch.triu_indices(mat.shape[0], mat.shape[1], offset=0)
+            tri_mask = _triu_mask(mat.shape[0], 0)
         else:
-            tri_mat = torch.tril(mat, diagonal=0)
-            tri_idx = torch.tril_indices(mat.shape[0], mat.shape[1], offset=0)
-        tri_mat *= vec
-        exp = mat.clone()
-        exp[tri_idx[0], tri_idx[1]] = tri_mat[tri_idx[0], tri_idx[1]]
-        return exp
+            tri_mask = _tril_mask(mat.shape[0], 0)
+        return torch.where(tri_mask, mat * vec, mat)
 
     @pytest.mark.parametrize("order", ["F", "C"])
     @pytest.mark.parametrize("upper", [True, False], ids=["upper", "lower"])
@@ -1,7 +1,10 @@
+import collections
+import threading
+
 import torch.cuda
 
 from .helpers import sizeof_dtype
-from .tensor_helpers import is_contig, is_contig_vec, is_f_contig
+from .tensor_helpers import extract_C, extract_fortran, is_contig, is_contig_vec, is_f_contig
 
 if torch.cuda.is_available():
     from falkon.c_ext import (
@@ -15,6 +18,53 @@ if torch.cuda.is_available():
         cuda_2d_copy_async,
     )
 
+_staging = threading.local()
+_NUM_STAGING_SLOTS = 2
+
+
+class _StagingSlot:
+    """Pinned host buffer used to change the data-type of tensors copied to or from the GPU.
+
+    The buffer grows as needed. When it is the source of an asynchronous copy, an event is
+    recorded so that the buffer is not overwritten before the copy has completed.
+    """
+
+    def __init__(self):
+        self.buf = None
+        self.event = None
+
+    def get(self, size, fortran, dtype):
+        """View of the buffer with the given size, in column-contiguous order if `fortran`."""
+        if self.event is not None:
+            self.event.synchronize()
+            self.event = None
+        numel = size[0] * size[1]
+        if self.buf is None or self.buf.numel() < numel:
+            self.buf = torch.empty(numel, dtype=dtype, pin_memory=True)
+        if fortran:
+            return extract_fortran(self.buf, size, offset=0)
+        return extract_C(self.buf, size, offset=0)
+
+    def record(self, device):
+        self.event = torch.cuda.Event()
+        self.event.record(torch.cuda.current_stream(device))
+
+
+def _staging_slot(dtype) -> _StagingSlot:
+    """Next staging slot for `dtype` on the current thread.
+
+    Slots are used round-robin, so that an asynchronous copy from one slot can overlap with
+    the data-type conversion into the next one.
+    """
+    rings = getattr(_staging, "rings", None)
+    if rings is None:
+        rings = _staging.rings = {}
+    if dtype not in rings:
+        rings[dtype] = collections.deque(_StagingSlot() for _ in range(_NUM_STAGING_SLOTS))
+    ring = rings[dtype]
+    ring.rotate(-1)
+    return ring[0]
+
 
 def check_copy(origin, dest, check_dtypes=True):
     if check_dtypes:
@@ -31,7 +81,7 @@ def check_copy(origin, dest, check_dtypes=True):
                 f"origin is F-contig (strides {origin.stride()}), while destination "
                 f"is not (strides {dest.stride()})"
             )
-    elif is_contig(origin):  # H is C-contiguous
+    elif is_contig(origin):  # origin is C-contiguous
         if not is_contig(dest) or is_f_contig(dest, strict=True):
             raise ValueError(
                 f"origin is C-contig (strides {origin.stride()}), while destination "
@@ -42,6 +92,15 @@ def check_copy(origin, dest, check_dtypes=True):
 
 
 def copy(origin, dest, non_blocking=False, allow_dtype_change=False):
+    if (
+        origin.device == dest.device
+        and origin.data_ptr() == dest.data_ptr()
+        and origin.shape == dest.shape
+        and origin.stride() == dest.stride()
+        and origin.dtype == dest.dtype
+    ):
+        # `origin` and `dest` are views of the same memory: nothing to copy.
+        return dest
     check_copy(origin, dest, check_dtypes=not allow_dtype_change)
 
     if origin.device.type == dest.device.type:
@@ -53,16 +112,82 @@ def copy(origin, dest, non_blocking=False, allow_dtype_change=False):
     return dest
 
 
+def _base(t):
+    return t if t._base is None else t._base
+
+
+def _merge_adjacent(prev, nxt):
+    """View spanning `prev` and `nxt` if the second directly follows the first in memory, else None."""
+    if _base(prev) is not _base(nxt) or prev.stride() != nxt.stride():
+        return None
+    for dim in (0, 1):
+        other = 1 - dim
+        if (
+            prev.shape[other] == nxt.shape[other]
+            and nxt.storage_offset() == prev.storage_offset() + prev.shape[dim] * prev.stride(dim)
+        ):
+            size = list(prev.shape)
+            size[dim] += nxt.shape[dim]
+            if prev.stride(dim) < prev.stride(other):
+                # `dim` runs along the lines of `other`: the end of one line is directly followed by the
+                # start of the next, so also check that the merged tile does not wrap onto the next line.
+                line_len = prev.stride(other) // prev.stride(dim)
+                start = (prev.storage_offset() - _base(prev).storage_offset()) % prev.stride(other)
+                if start // prev.stride(dim) + size[dim] > line_len:
+                    continue
+            return prev.as_strided(size, prev.stride(), prev.storage_offset())
+    return None
+
+
+def copy_batched(pairs, non_blocking=False, allow_dtype_change=False):
+    """Copy a sequence of `(origin, dest)` tiles, with as few transfers as possible.
+
+    Consecutive tiles which are adjacent slices of the same tensors, both for the origins and
+    for the destinations, are merged and copied with a single call to :func:`copy`. This saves
+    the fixed overhead of each transfer when there are many small tiles.
+
+    Parameters
+    ----------
+    pairs
+        Sequence of `(origin, dest)` tuples of 2D tensors.
+    non_blocking
+        Whether the copies should be asynchronous with respect to the host.
+    allow_dtype_change
+        Whether origin and destination tensors may have different data-types.
+
+    Returns
+    -------
+    dests
+        The list of destination tensors.
+    """
+    pairs = list(pairs)
+    if len(pairs) == 0:
+        return []
+    cur_origin, cur_dest = pairs[0]
+    for origin, dest in pairs[1:]:
+        merged_origin = _merge_adjacent(cur_origin, origin)
+        merged_dest = _merge_adjacent(cur_dest, dest) if merged_origin is not None else None
+        if merged_dest is not None and merged_origin.shape == merged_dest.shape:
+            cur_origin, cur_dest = merged_origin, merged_dest
+        else:
+            copy(cur_origin, cur_dest, non_blocking=non_blocking, allow_dtype_change=allow_dtype_change)
+            cur_origin, cur_dest = origin, dest
+    copy(cur_origin, cur_dest, non_blocking=non_blocking, allow_dtype_change=allow_dtype_change)
+    return [dest for _, dest in pairs]
+
+
 # noinspection PyProtectedMember
 def copy_to_host(rows, cols, D, Di, Dj, H, Hi, Hj, non_blocking=False):
     D_narrow = D.narrow(0, Di, rows).narrow(1, Dj, cols)
     H_narrow = H.narrow(0, Hi, rows).narrow(1, Hj, cols)
+    # The memory layout of `D` decides the copy routine, and the layout of the staging buffer.
+    D_fortran = is_f_contig(D, strict=True)
 
     H_narrow_final = None
     if H.dtype != D.dtype:
         # First copy `D_narrow` to a matrix with the same dtype on the host
         # then copy this last matrix to `H_narrow` (at the end of this function).
-        H_temp = torch.empty_like(D_narrow, device=H.device)
+        H_temp = _staging_slot(D.dtype).get(D_narrow.shape, D_fortran, D.dtype)
         H_narrow_final = H_narrow
         H_narrow = H_temp
 
@@ -73,7 +198,7 @@ def copy_to_host(rows, cols, D, Di, Dj, H, Hi, Hj, non_blocking=False):
             cuda_1d_copy_async(src_tensor=D_narrow, dest_tensor=H_narrow, count=(rows * cols) * dts)
         else:
             cuda_1d_copy(src_tensor=D_narrow, dest_tensor=H_narrow, count=(rows * cols) * dts)
-    elif is_f_contig(D, strict=True):
+    elif D_fortran:
         if non_blocking:
             cublas_2d_copy_to_host_async(rows, cols, dts, D_narrow, D_narrow.stride(1), H_narrow, H_narrow.stride(1))
         else:
@@ -99,6 +224,10 @@ def copy_to_host(rows, cols, D, Di, Dj, H, Hi, Hj, non_blocking=False):
             )
 
     if H.dtype != D.dtype:
+        if non_blocking:
+            # The copy into pinned memory may still be running. Since the cast happens on the
+            # host, there is no way around waiting for it.
+            torch.cuda.current_stream(D.device).synchronize()
         H_narrow_final.copy_(H_narrow)  # Blocking copy since it's H->H.
 
 
@@ -106,12 +235,16 @@ def copy_to_host(rows, cols, D, Di, Dj, H, Hi, Hj, non_blocking=False):
 def copy_to_device(rows, cols, H, Hi, Hj, D, Di, Dj, non_blocking=False):
     H_narrow = H.narrow(0, Hi, rows).narrow(1, Hj, cols)
     D_narrow = D.narrow(0, Di, rows).narrow(1, Dj, cols)
+    # The memory layout of `H` decides the copy routine, and the layout of the staging buffer.
+    H_fortran = is_f_contig(H, strict=True)
 
+    staging = None
     if H.dtype != D.dtype:
         # First copy `H_narrow` to another matrix with correct dtype also on host
         # then copy this last matrix to `D`.
-        H_right_dt = torch.empty_like(H_narrow, dtype=D.dtype)
-        H_right_dt.copy_(H)  # Copy here will be blocking since it's H->H
+        staging = _staging_slot(D.dtype)
+        H_right_dt = staging.get(H_narrow.shape, H_fortran, D.dtype)
+        H_right_dt.copy_(H_narrow)  # Copy here will be blocking since it's H->H
         H_narrow = H_right_dt
 
     dts = sizeof_dtype(D.dtype)
@@ -120,7 +253,7 @@ def copy_to_device(rows, cols, H, Hi, Hj, D, Di, Dj, non_blocking=False):
             cuda_1d_copy_async(src_tensor=H_narrow, dest_tensor=D_narrow, count=(rows * cols) * dts)
         else:
             cuda_1d_copy(src_tensor=H_narrow, dest_tensor=D_narrow, count=(rows * cols) * dts)
-    elif is_f_contig(H, strict=True):
+    elif H_fortran:
         if non_blocking:
             cublas_2d_copy_to_dev_async(rows, cols, dts, H_narrow, H_narrow.stride(1), D_narrow, D_narrow.stride(1))
         else:
@@ -144,4 +277,7 @@ def copy_to_device(rows, cols, H, Hi, Hj, D, Di, Dj, non_blocking=False):
                 width=cols * dts,
                 height=rows,
             )
+    if staging is not None and non_blocking:
+        # The staging buffer is only reused once this copy has completed.
+        staging.record(D.device)
     return D_narrow
@@ -238,11 +238,38 @@ def cast_tensor(tensor: torch.Tensor, dtype: torch.dtype, warn: bool = True) ->
 
 
 def move_tensor(tensor: torch.Tensor, device: Union[torch.device, str]) -> torch.Tensor:
+    """Copies a tensor to a different device, preserving its strides
+
+    Parameters
+    -----------
+    tensor : torch.Tensor
+        The tensor to be moved. If it is already on `device` it is returned unchanged.
+    device : str or torch.device
+        The target device (e.g. 'cpu', 'cuda:0')
+
+    Returns
+    --------
+    new_tensor : torch.Tensor
+        A tensor on `device` with the same data and strides as `tensor`.
+
+    Notes
+    ------
+    Copies from pageable host memory to a CUDA device are asynchronous: `tensor` is first
+    copied into a private page-locked buffer (an extra host copy, after which `tensor` may be
+    modified), and the transfer is then queued on the current stream of `device`. The returned
+    tensor is therefore only safe to use from that stream; work on other streams must first
+    synchronize with it. Copies from pinned memory, and to the host, are synchronous.
+    """
     if str(device) == str(tensor.device):
         return tensor
 
     new_tensor = create_same_stride(tensor.size(), tensor, tensor.dtype, device)
-    new_tensor.copy_(tensor)
+    if new_tensor.is_cuda and not tensor.is_cuda and not tensor.is_pinned():
+        # Stage the host -> device transfer through page-locked memory so that it can run
+        # asynchronously. Device -> host copies remain synchronous.
+        new_tensor.copy_(tensor.pin_memory(), non_blocking=True)
+    else:
+        new_tensor.copy_(tensor)
     return new_tensor
 
 
@@ -158,6 +158,7 @@ test_requires = [
     "pandas",
     "pytest",
     "pytest-cov",
+    "pytest-xdist",
     "coverage[toml]",
     "codecov",
     "flake8",